@@ -13,14 +13,13 @@ from typing import Dict
 
 import boto3
 
-cf_client = boto3.client('cloudformation')
+from paginator import paginate
 
+cf_client = boto3.client('cloudformation')
 
-def get_stacks(next_token: str = None):
-    stacks = []
 
+def get_stacks():
     options = {
-        'NextToken': next_token,
         'StackStatusFilter': [
             'CREATE_COMPLETE',
             'CREATE_IN_PROGRESS',
@@ -31,19 +30,10 @@ def get_stacks(next_token: str = None):
         ]
     }
 
-    if next_token is None:
-        del options['NextToken']
-
-    response = cf_client.list_stacks(**options)
-
     cloudformation = boto3.resource('cloudformation')
 
-    if 'NextToken' in response:
-        stacks += get_stacks(next_token=response['NextToken'])
-
-    stacks += [cloudformation.Stack(stack['StackName']) for stack in response['StackSummaries']]
-
-    return stacks
+    for stack in paginate(cf_client, 'list_stacks', prefetch=True, **options):
+        yield cloudformation.Stack(stack['StackName'])
 
 
 def find_resource_in_stacks(resource_type: str) -> Dict:
@@ -1,5 +1,7 @@
 import boto3
 
+from paginator import paginate
+
 
 class Found(Exception): pass
 
@@ -18,33 +20,21 @@ region = 'ap-northeast-1'
 stream_name = '2019/08/05/[$LATEST]9bdb4da74beb4677b374d3d6b4d17283'
 
 client = boto3.client('logs', region_name=region)
-next_token = None
-
-response = client.describe_log_groups(
-    logGroupNamePrefix='/'
-)
 
 try:
-    while True:
-        for log_group in response['logGroups']:
-            print('Checking {0}...'.format(log_group['logGroupName']))
-
-            streams = client.describe_log_streams(
-                logGroupName=log_group['logGroupName']
-            )
-
-            if len(streams['logStreams']):
-                for stream in streams['logStreams']:
-                    if stream_name == stream['logStreamName']:
-                        print('FOUND')
-                        raise Found
-
-        if 'nextToken' not in response:
-            break
-
-        response = client.describe_log_groups(
-            logGroupNamePrefix='/',
-            nextToken=response['nextToken']
+    for log_group in paginate(client, 'describe_log_groups', prefetch=True, logGroupNamePrefix='/'):
+        print('Checking {0}...'.format(log_group['logGroupName']))
+
+        # Stream names are unique within a log group so they can be looked up by prefix
+        streams = paginate(
+            client, 'describe_log_streams',
+            logGroupName=log_group['logGroupName'],
+            logStreamNamePrefix=stream_name
         )
+
+        for stream in streams:
+            if stream_name == stream['logStreamName']:
+                print('FOUND')
+                raise Found
 except Found:
     pass
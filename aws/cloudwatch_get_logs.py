@@ -3,6 +3,8 @@ from typing import NamedTuple
 
 import boto3
 
+from paginator import paginate
+
 PROFILE = 'dnp-dmps-stg'
 LOG_GROUP = '/aws/lambda/DnpPosStg24-a0026d-stg24-code-stack-APIHandler-PZ5TEF54GUQQ'
 
@@ -46,52 +48,38 @@ def boto_resource(service: str):
     return resource
 
 
-def get_log_streams(log_group_name: str, next_token: str = None) -> StreamItem:
+def get_log_streams(log_group_name: str) -> StreamItem:
     cw_logs_client = boto_client('logs')
 
     parameters = dict(
         logGroupName=log_group_name,
         orderBy='LastEventTime',
-        descending=True,
-        nextToken=next_token
+        descending=True
     )
 
-    if next_token is None:
-        del parameters['nextToken']
-
-    response = cw_logs_client.describe_log_streams(**parameters)
-
-    for stream in response['logStreams']:
+    for stream in paginate(cw_logs_client, 'describe_log_streams', **parameters):
         yield StreamItem(*list(stream.values()))
 
-    if 'nextToken' in response:
-        get_log_streams(log_group_name, next_token=response['nextToken'])
-
 
-def get_log_events(log_group_name: str, log_stream_name: str, next_token: str = None) -> LogItem:
+def get_log_events(log_group_name: str, log_stream_name: str) -> LogItem:
     cw_logs_client = boto_client('logs')
 
     start_time, end_time = log_events_time_range(hours=1)
 
+    # get_log_events has no boto3 paginator, the forward token is followed from the oldest event until it repeats
     parameters = dict(
         logGroupName=log_group_name,
         logStreamName=log_stream_name,
         startTime=int(start_time.timestamp() * 1000),
         endTime=int(end_time.timestamp() * 1000),
-        nextToken=next_token
+        startFromHead=True,
+        input_token='nextToken',
+        output_token='nextForwardToken'
     )
 
-    if next_token is None:
-        del parameters['nextToken']
-
-    response = cw_logs_client.get_log_events(**parameters)
-
-    for log_item in response['events']:
+    for log_item in paginate(cw_logs_client, 'get_log_events', 'events', **parameters):
         yield LogItem(*list(log_item.values()))
 
-    if 'nextToken' in response:
-        get_log_streams(log_group_name, log_stream_name, next_token=response['nextToken'])
-
 
 def run():
     for stream in get_log_streams(LOG_GROUP):
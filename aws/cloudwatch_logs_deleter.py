@@ -1,47 +1,121 @@
 """
 Finds log groups with partial matching name and deletes them
 
+All regions are searched at the same time on a thread pool, each with its own client, and matches are printed as
+they arrive. If the pattern is anchored with ^, its literal prefix is sent as logGroupNamePrefix so only the log groups
+that can match are listed.
+
 Parameters:
-    --search-name The partial/full name of the log group/s
+    --name Regular expression searched in the log group names, anchor it with ^ to list less log groups
     --regions List of regions to search for LogGroups
+    --threads Number of regions searched concurrently
+    --delete Deletes the matching log groups, they are only listed otherwise
+    --dry-run Goes through the deletion without calling the API
+    --concurrency Number of log groups deleted concurrently
+    --rate Largest number of deletions per second in each region
 
 Example:
-    python cloudwatch_logs_deleter.py --name /aws/lambda/test --regions ap-northeast-1 us-west-1
-    python cloudwatch_logs_deleter.py --name aws --regions ap-northeast-1
+    python cloudwatch_logs_deleter.py --name ^/aws/lambda/test --regions ap-northeast-1 us-west-1
+    python cloudwatch_logs_deleter.py --name aws --regions ap-northeast-1 --delete --dry-run
 """
 import argparse
+import contextlib
+import queue
 import re
+import sys
 from argparse import Namespace
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Pattern, Tuple
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from log_group_deleter import DELETE_CLIENT_CONFIG, DELETE_LOG_GROUP_RATE, LogGroupDeleter
+from paginator import paginate
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Put in the queue by a region once it is fully searched
+DONE = object()
+
+
+def get_literal_prefix(pattern: str) -> str:
+    """
+    Gets the literal text every match of an anchored pattern starts with
+
+    :param pattern: Regular expression
+    :return: Literal prefix, empty if the pattern is not anchored at the start or is case insensitive
+    """
+    parsed = sre_parse.parse(pattern)
+
+    if parsed.state.flags & re.IGNORECASE or not len(parsed) or parsed[0] != (sre_parse.AT, sre_parse.AT_BEGINNING):
+        return ''
+
+    prefix = []
+
+    for op, value in parsed[1:]:
+        if op != sre_parse.LITERAL:
+            break
+
+        prefix.append(chr(value))
 
+    return ''.join(prefix)
 
-def get_all_log_groups(log_group_name: str, region: str, next_token: str = None) -> List[Dict]:
-    cloud_watch_client = boto3.client('logs', region_name=region)
 
-    log_groups = []
+def get_clients(regions: Iterable[str], config: Config = None) -> Dict[str, 'boto3.client']:
+    # Clients are thread safe but creating them from a shared session is not, so they are created up front
+    session = boto3.session.Session()
 
-    parameters = {
-        'nextToken': next_token
-    }
+    return {region: session.client('logs', region_name=region, config=config) for region in regions}
 
-    if next_token is None:
-        del parameters['nextToken']
 
-    try:
-        response = cloud_watch_client.describe_log_groups(**parameters)
+def get_all_log_groups(client, pattern: Pattern, prefix: str = '') -> Iterator[str]:
+    parameters = {'logGroupNamePrefix': prefix} if prefix else {}
 
-        if 'nextToken' in response:
-            log_groups += get_all_log_groups(next_token=response['nextToken'])
+    for log_group in paginate(client, 'describe_log_groups', prefetch=True, **parameters):
+        if pattern.search(log_group['logGroupName']):
+            yield log_group['logGroupName']
 
-        log_groups += response['logGroups']
 
-        for log_group in log_groups:
-            if re.search(log_group_name, log_group['logGroupName']):
-                yield log_group['logGroupName']
-    except cloud_watch_client.exceptions.UnrecognizedClientException:
-        pass
+def search_regions(name: str, clients: Dict[str, 'boto3.client'], threads: int = 8) -> Iterator[Tuple[str, object]]:
+    """
+    Searches the log groups of every region concurrently
+
+    :param name: Regular expression searched in the log group names
+    :param clients: Logs client of every region
+    :param threads: Number of regions searched concurrently
+    :return: Region and matching log group name as they are found, or the error if a region could not be searched
+    """
+    pattern = re.compile(name)
+    prefix = get_literal_prefix(name)
+    results = queue.Queue()
+
+    def search(region: str) -> None:
+        try:
+            for log_group in get_all_log_groups(clients[region], pattern, prefix):
+                results.put((region, log_group))
+        except (BotoCoreError, ClientError) as e:
+            results.put((region, e))
+        finally:
+            results.put((region, DONE))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for region in clients:
+            executor.submit(search, region)
+
+        remaining = len(clients)
+
+        while remaining:
+            region, result = results.get()
+
+            if result is DONE:
+                remaining -= 1
+            else:
+                yield region, result
 
 
 def get_regions(regions: List) -> List:
@@ -53,13 +127,29 @@ def get_regions(regions: List) -> List:
 
 
 def run(args: Namespace) -> None:
-    for region in get_regions(args.regions):
-        client = boto3.client('logs', region_name=region)
-        print(f'[{region}]')
+    clients = get_clients(get_regions(args.regions))
+    deleter = None
+
+    with contextlib.ExitStack() as stack:
+        if args.delete:
+            # Separate clients so the search keeps the retries of botocore
+            delete_clients = get_clients(clients, DELETE_CLIENT_CONFIG)
+            deleter = stack.enter_context(
+                LogGroupDeleter(concurrency=args.concurrency, rate=args.rate, dry_run=args.dry_run)
+            )
+
+        for region, result in search_regions(args.name, clients, args.threads):
+            if isinstance(result, Exception):
+                print(f'[{region}] {result}', file=sys.stderr)
+                continue
+
+            print(f'[{region}]\t{result}')
+
+            if deleter is not None:
+                deleter.submit(delete_clients[region], result)
 
-        for log_group in get_all_log_groups(args.name, region):
-            print(f'\t{log_group}')
-            # client.delete_log_group(logGroupName=log_group)
+    if deleter is not None:
+        deleter.summary.print()
 
 
 if __name__ == '__main__':
@@ -69,6 +159,11 @@ if __name__ == '__main__':
 
     parser.add_argument('--name', type=str, required=True)
     parser.add_argument('--regions', nargs="+", required=True)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--delete', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=DELETE_LOG_GROUP_RATE)
 
     args = parser.parse_args()
 
@@ -1,209 +1,434 @@
 """
 Finds non-existing resources in AWS and deletes their LogGroups. Currently supports the ff:
-    API Gateway Execution Logs
-    CodeBuild Logs
-    Lambda Logs
+    apigateway: API Gateway Execution Logs
+    codebuild: CodeBuild Logs
+    lambda: Lambda Logs
+    states: Step Functions Logs, under the /aws/vendedlogs/states/<name>-Logs name the console creates
+    ecs: ECS Logs, under the /ecs/<task definition family> name the console creates
+    rds-instance: RDS instance Logs
+    rds-cluster: RDS (Aurora) cluster Logs
+
+Every resource type and its log groups are listed concurrently into sets, the log groups of the resources that no
+longer exist are then a set difference. A resource type is added by subclassing LogGroup. Log groups under a prefix
+that are not named after a resource (e.g. /ecs/<cluster>/<service>) are printed as skipped and never deleted.
+
+Several accounts and regions are swept in one run: every account, given as a profile or as a role ARN to assume, gets
+one session and every (account, region) one set of clients, shared by all the calls. The sweeps run concurrently and
+the deletions of all of them go through one LogGroupDeleter, which limits the rate of every account and region
+separately. Assumed role credentials are not refreshed, use a profile with role_arn for sweeps longer than an hour.
+
+Parameters:
+    --accounts Profiles or role ARNs to sweep, defaults to the default credentials
+    --regions Regions to sweep in every account, defaults to the region of the profile
+    --sweeps Number of (account, region) pairs swept concurrently
+    --report File where the report of every sweep is written as JSON
+    --types Resource types whose log groups are checked, defaults to apigateway, codebuild and lambda
+    --threads Number of listings run concurrently
+    --dry-run Lists the log groups that would be deleted without deleting them
+    --concurrency Number of log groups deleted concurrently
+    --rate Largest number of deletions per second
 
 Example:
-    python cloudwatch_logs_missing_resource_logs_deleter.py
+    python cloudwatch_logs_missing_resource_logs_deleter.py --dry-run
+    python cloudwatch_logs_missing_resource_logs_deleter.py --types lambda states ecs --dry-run
+    python cloudwatch_logs_missing_resource_logs_deleter.py --accounts dev arn:aws:iam::123456789012:role/cleaner \\
+        --regions us-east-1 ap-northeast-1 --sweeps 8 --report report.json --dry-run
 """
-import logging
+import argparse
+import json
 import re
-from typing import Dict, List
+import sys
+import threading
+from argparse import Namespace
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import product
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Type
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-lambda_client = boto3.client('lambda')
-cloud_watch_client = boto3.client('logs')
-code_build_client = boto3.client('codebuild')
-apig_client = boto3.client('apigateway')
-
-
-# class LogGroup:
-#
-#     def __init__(self, client: str, method: str) -> None:
-#         self.client = boto3.client(client)
-#         self.get_all_method = getattr(self.client, method)
-#         self.method_parameters = {}
-#         self.token_name = 'nextToken'
-#
-#         super().__init__()
-#
-#     def get_log_groups(self, prefix: str = '/', next_token: str = None):
-#         log_groups = []
-#
-#         parameters = {
-#             'logGroupNamePrefix': prefix,
-#             'nextToken': next_token
-#         }
-#
-#         if next_token is None:
-#             del parameters['nextToken']
-#
-#         response = cloud_watch_client.describe_log_groups(**parameters)
-#
-#         if 'nextToken' in response:
-#             log_groups += get_all_log_groups(next_token=response['nextToken'])
-#
-#         log_groups += [log_group['logGroupName'] for log_group in response['logGroups']]
-#
-#         return sorted(log_groups, key=lambda s: s.lower())
-#
-#     def get_resources(self, next_token: str = None):
-#         lambda_functions = []
-#
-#         if next_token is not None:
-#             self.method_parameters[self.token_name] = next_token
-#
-#         response = lambda_client.list_functions(**self.method_parameters)
-#
-#         if self.token_name in response:
-#             lambda_functions += get_all_functions(marker=response[self.token_name])
-#
-#         lambda_functions += [lambda_function['FunctionName'] for lambda_function in response['Functions']]
-#
-#         return sorted(lambda_functions, key=lambda s: s.lower())
-#
-#
-# class LambdaLogGroup(LogGroup):
-#
-#     def __init__(self) -> None:
-#         super().__init__('lambda', 'list_functions')
-#
-#         self.marker_name = 'nextToken'
-#
-#
-# class ApiGatewayLogGroup(LogGroup):
-#     def __init__(self) -> None:
-#         super().__init__('apigateway', 'get_rest_apis')
-#
-#         self.marker_name = 'position'
-#
-#
-# class CodeBuildLogGroup(LogGroup):
-#     def __init__(self) -> None:
-#         super().__init__('codebuild', 'list_projects')
-#
-#         self.marker_name = 'NextToken'
-
-
-def get_all_log_groups(prefix: str = '', next_token: str = None) -> List[Dict]:
-    log_groups = []
-
-    parameters = {
-        'logGroupNamePrefix': prefix,
-        'nextToken': next_token
-    }
+from log_group_deleter import DELETE_CLIENT_CONFIG, DELETE_LOG_GROUP_RATE, LogGroupDeleter
+from paginator import paginate
 
-    if next_token is None:
-        del parameters['nextToken']
+LOG_GROUPS: Dict[str, Type['LogGroup']] = {}
+DEFAULT_TYPES = ['apigateway', 'codebuild', 'lambda']
+ROLE_SESSION_NAME = 'missing-resource-logs-deleter'
 
-    if prefix == '':
-        del parameters['logGroupNamePrefix']
 
-    response = cloud_watch_client.describe_log_groups(**parameters)
+def register(name: str) -> Callable:
+    def decorator(log_group: Type['LogGroup']) -> Type['LogGroup']:
+        LOG_GROUPS[name] = log_group
 
-    if 'nextToken' in response:
-        log_groups += get_all_log_groups(next_token=response['nextToken'])
+        return log_group
 
-    log_groups += [log_group['logGroupName'] for log_group in response['logGroups']]
+    return decorator
 
-    return sorted(log_groups, key=lambda s: s.lower())
 
+class LogGroup(object):
+    """
+    This class describes the log groups a service creates for its resources, e.g. /aws/lambda/<function name>.
 
-def get_all_functions(marker: str = None) -> List[Dict]:
-    lambda_functions = []
+    Subclasses set the client and the call listing the resources, the key holding the resource names and the log group
+    name around it: prefix is literal, name_pattern and suffix are regular expressions. Log groups under the prefix
+    whose name does not have this shape were not created for a resource and are skipped.
+    """
+    service: str = None
+    operation: str = None
+    result_key: str = None
+    name_key: str = None
+    parameters: Dict[str, Any] = {}
+    prefix: str = ''
+    name_pattern: str = '.+'
+    suffix: str = ''
+
+    def __init__(self, client, logs_client) -> None:
+        self.client = client
+        self.logs_client = logs_client
+        self.pattern = re.compile(f'^{re.escape(self.prefix)}({self.name_pattern}){self.suffix}$')
 
-    parameters = {
-        'Marker': marker
+        super().__init__()
+
+    def get_name(self, resource: Any) -> str:
+        return resource[self.name_key] if self.name_key else resource
+
+    def get_resources(self) -> Set[str]:
+        return {
+            self.get_name(resource)
+            for resource in paginate(self.client, self.operation, self.result_key, **self.parameters)
+        }
+
+    def get_log_groups(self) -> Set[str]:
+        return {
+            log_group['logGroupName']
+            for log_group in paginate(self.logs_client, 'describe_log_groups', logGroupNamePrefix=self.prefix)
+        }
+
+    def get_resource_name(self, log_group: str) -> Optional[str]:
+        match = self.pattern.match(log_group)
+
+        return match.group(1) if match else None
+
+    def get_orphaned_log_groups(self, resources: Set[str], log_groups: Set[str]) -> Set[str]:
+        """
+        Gets the log groups of the resources that do not exist
+
+        :param resources: Names of the existing resources
+        :param log_groups: Names of the log groups under the prefix
+        :return: Names of the log groups to delete
+        """
+        names = {log_group: self.get_resource_name(log_group) for log_group in log_groups}
+        missing = set(names.values()) - resources - {None}
+
+        return {log_group for log_group, name in names.items() if name in missing}
+
+    def get_skipped_log_groups(self, log_groups: Set[str]) -> Set[str]:
+        """
+        Gets the log groups under the prefix that are not named after a resource, they are never deleted
+
+        :param log_groups: Names of the log groups under the prefix
+        :return: Names of the log groups that do not have the shape of the log groups of the resources
+        """
+        return {log_group for log_group in log_groups if self.get_resource_name(log_group) is None}
+
+
+@register('lambda')
+class LambdaLogGroup(LogGroup):
+    service = 'lambda'
+    operation = 'list_functions'
+    name_key = 'FunctionName'
+    prefix = '/aws/lambda/'
+
+
+@register('codebuild')
+class CodeBuildLogGroup(LogGroup):
+    service = 'codebuild'
+    operation = 'list_projects'
+    prefix = '/aws/codebuild/'
+
+
+@register('apigateway')
+class ApiGatewayLogGroup(LogGroup):
+    service = 'apigateway'
+    operation = 'get_rest_apis'
+    name_key = 'id'
+    prefix = 'API-Gateway-Execution-Logs_'
+    suffix = '/.+'
+
+
+@register('states')
+class StepFunctionsLogGroup(LogGroup):
+    service = 'stepfunctions'
+    operation = 'list_state_machines'
+    name_key = 'name'
+    prefix = '/aws/vendedlogs/states/'
+    suffix = '-Logs'
+
+
+@register('ecs')
+class EcsLogGroup(LogGroup):
+    service = 'ecs'
+    operation = 'list_task_definition_families'
+    # Services keep running deregistered (INACTIVE) revisions, so their families still own their log groups
+    parameters = {'status': 'ALL'}
+    # Only the awslogs-group of the console task definition wizard, /ecs/<family>, is tied to a resource
+    prefix = '/ecs/'
+    name_pattern = '[A-Za-z0-9_-]{1,255}'
+
+
+@register('rds-instance')
+class RdsInstanceLogGroup(LogGroup):
+    service = 'rds'
+    operation = 'describe_db_instances'
+    name_key = 'DBInstanceIdentifier'
+    prefix = '/aws/rds/instance/'
+    suffix = '/.+'
+
+
+@register('rds-cluster')
+class RdsClusterLogGroup(LogGroup):
+    service = 'rds'
+    operation = 'describe_db_clusters'
+    name_key = 'DBClusterIdentifier'
+    prefix = '/aws/rds/cluster/'
+    suffix = '/.+'
+
+
+class ClientCache(object):
+    """
+    This class creates the session of every account and the clients of every account and region once.
+    """
+
+    def __init__(self, session: boto3.session.Session = None) -> None:
+        self.session = session or boto3.session.Session()
+        self.sessions: Dict[Optional[str], boto3.session.Session] = {None: self.session}
+        self.clients: Dict[Tuple[Optional[str], Optional[str], str, Optional[Config]], Any] = {}
+        # Clients are thread safe but creating them from a shared session is not
+        self.lock = threading.Lock()
+
+        super().__init__()
+
+    def create_session(self, account: str) -> boto3.session.Session:
+        if not account.startswith('arn:'):
+            return boto3.session.Session(profile_name=account)
+
+        credentials = self.session.client('sts').assume_role(
+            RoleArn=account, RoleSessionName=ROLE_SESSION_NAME
+        )['Credentials']
+
+        return boto3.session.Session(
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken'],
+            region_name=self.session.region_name
+        )
+
+    def get_session(self, account: str = None) -> boto3.session.Session:
+        """
+        Gets the session of an account
+
+        :param account: Profile or role ARN to assume, None for the default credentials
+        :return: Session of the account
+        """
+        with self.lock:
+            if account not in self.sessions:
+                self.sessions[account] = self.create_session(account)
+
+            return self.sessions[account]
+
+    def get_client(self, service: str, account: str = None, region: str = None, config: Config = None):
+        """
+        Gets the client of a service in an account and region
+
+        :param service: Name of the service, e.g. 'logs'
+        :param account: Profile or role ARN to assume, None for the default credentials
+        :param region: Region of the client, None for the region of the account session
+        :param config: Configuration of the client, clients with different configurations are cached separately
+        :return: boto3 client
+        """
+        session = self.get_session(account)
+        key = (account, region, service, config)
+
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = session.client(service, region_name=region, config=config)
+
+            return self.clients[key]
+
+
+def get_log_group_types(names: Iterable[str], get_client: Callable[[str], Any]) -> List[LogGroup]:
+    logs_client = get_client('logs')
+
+    return [LOG_GROUPS[name](get_client(LOG_GROUPS[name].service), logs_client) for name in names]
+
+
+def get_inventory(log_group_types: List[LogGroup], threads: int = 8) -> Dict[LogGroup, Tuple[Set[str], Set[str]]]:
+    """
+    Lists the resources and the log groups of every resource type concurrently
+
+    :param log_group_types: Resource types to list
+    :param threads: Number of listings run concurrently
+    :return: Names of the existing resources and of the log groups of every resource type
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        resources = {
+            log_group_type: executor.submit(log_group_type.get_resources) for log_group_type in log_group_types
+        }
+        log_groups = {
+            log_group_type: executor.submit(log_group_type.get_log_groups) for log_group_type in log_group_types
+        }
+
+    return {
+        log_group_type: (resources[log_group_type].result(), log_groups[log_group_type].result())
+        for log_group_type in log_group_types
     }
 
-    if marker is None:
-        del parameters['Marker']
 
-    response = lambda_client.list_functions(**parameters)
+def delete_log_groups(log_group_types: List[LogGroup], threads: int = 8, deleter: LogGroupDeleter = None,
+                      location: str = None, delete_client=None) -> Dict[str, Future]:
+    """
+    Deletes the log groups of the resources that do not exist
 
-    if 'NextMark' in response:
-        lambda_functions += get_all_functions(marker=response['NextMark'])
+    :param log_group_types: Resource types to check
+    :param threads: Number of listings run concurrently
+    :param deleter: Deleter the log groups are submitted to, one is created and closed if not given
+    :param location: Account and region of the log groups, printed before them and used in the deleter summary
+    :param delete_client: Logs client the deletions are made with, created with DELETE_CLIENT_CONFIG, defaults to the
+                          logs client of each resource type
+    :return: Deletion status future of every deleted log group
+    """
+    if deleter is None:
+        with LogGroupDeleter() as deleter:
+            return delete_log_groups(log_group_types, threads, deleter, location, delete_client)
 
-    lambda_functions += [lambda_function['FunctionName'] for lambda_function in response['Functions']]
+    deleted_log_groups = {}
 
-    return sorted(lambda_functions, key=lambda s: s.lower())
+    for log_group_type, (resources, log_groups) in get_inventory(log_group_types, threads).items():
+        for log_group in sorted(log_group_type.get_skipped_log_groups(log_groups), key=str.lower):
+            print(f'[{location}] Skipping: {log_group}' if location else f'Skipping: {log_group}')
 
+        for log_group in sorted(log_group_type.get_orphaned_log_groups(resources, log_groups), key=str.lower):
+            print(f'[{location}] Deleting: {log_group}' if location else f'Deleting: {log_group}')
 
-def get_all_apis(next_token: str = None) -> List[Dict]:
-    apis = []
+            deleted_log_groups[log_group] = deleter.submit(
+                delete_client or log_group_type.logs_client, log_group, location
+            )
 
-    parameters = {
-        'position': next_token
-    }
+    return deleted_log_groups
 
-    if next_token is None:
-        del parameters['position']
 
-    response = apig_client.get_rest_apis(**parameters)
+def sweep(cache: ClientCache, account: Optional[str], region: Optional[str], types: List[str], threads: int,
+          deleter: LogGroupDeleter) -> Tuple[Dict, Dict[str, Future]]:
+    """
+    Deletes the log groups of the resources that do not exist in an account and region
 
-    if 'NextToken' in response:
-        apis += get_all_apis(next_token=response['position'])
+    :param cache: Sessions and clients shared by the sweeps
+    :param account: Profile or role ARN to assume, None for the default credentials
+    :param region: Region to sweep, None for the region of the account session
+    :param types: Names of the resource types to check
+    :param threads: Number of listings run concurrently
+    :param deleter: Deleter shared by the sweeps
+    :return: Report of the sweep and deletion status future of every deleted log group
+    """
+    report = {'account': account or 'default', 'region': region, 'error': None}
+    deleted_log_groups = {}
 
-    apis += [api['id'] for api in response['items']]
+    try:
+        report['region'] = region or cache.get_session(account).region_name
 
-    return sorted(apis, key=lambda s: s.lower())
+        log_group_types = get_log_group_types(types, lambda service: cache.get_client(service, account, region))
+        deleted_log_groups = delete_log_groups(
+            log_group_types, threads, deleter, f"{report['account']}/{report['region']}",
+            cache.get_client('logs', account, region, DELETE_CLIENT_CONFIG)
+        )
+    except (BotoCoreError, ClientError) as e:
+        report['error'] = str(e)
 
+    return report, deleted_log_groups
 
-def get_all_code_build_projects(next_token: str = None) -> List[Dict]:
-    projects = []
 
-    parameters = {
-        'sortOrder': 'ASCENDING',
-        'sortBy': 'NAME',
-        'nextToken': next_token
-    }
+def get_status(future: Future) -> str:
+    return 'failed' if future.exception() is not None else future.result()
 
-    if next_token is None:
-        del parameters['nextToken']
 
-    response = code_build_client.list_projects(**parameters)
+def get_report(sweeps: List[Tuple[Dict, Dict[str, Future]]]) -> List[Dict]:
+    """
+    Adds the outcome of the deletions to the report of every sweep, once the deleter is closed
 
-    if 'nextToken' in response:
-        projects += get_all_code_build_projects(next_token=response['nextToken'])
+    :param sweeps: Report and deletion status futures of every sweep
+    :return: Report of every sweep
+    """
+    reports = []
 
-    projects += [project_name for project_name in response['projects']]
+    for report, deleted_log_groups in sweeps:
+        statuses = Counter(get_status(future) for future in deleted_log_groups.values())
 
-    return sorted(projects, key=lambda s: s.lower())
+        reports.append({
+            **report,
+            "orphaned": len(deleted_log_groups),
+            "deleted": statuses['deleted'],
+            "missing": statuses['missing'],
+            "failed": [log_group for log_group, future in deleted_log_groups.items() if get_status(future) == 'failed']
+        })
 
+    return reports
 
-def delete_log_groups(prefix: str, resources: List[str], suffix: str = '') -> None:
-    log_groups = get_all_log_groups(prefix=prefix)
-    deleted_log_groups = []
 
-    for log_group in log_groups:
-        try:
-            log_group_function_name = re.search(f'^{prefix}(.+){suffix}$', log_group).group(1)
-        except AttributeError:
+def print_report(reports: List[Dict], file=sys.stdout) -> None:
+    for report in reports:
+        if report['error']:
+            print(f"[{report['account']}/{report['region']}] Error: {report['error']}", file=file)
             continue
 
-        if log_group_function_name not in resources:
-            print(f'Deleting: {log_group}')
+        print(
+            f"[{report['account']}/{report['region']}] Orphaned: {report['orphaned']}, deleted: {report['deleted']}, "
+            f"already gone: {report['missing']}, failed: {len(report['failed'])}",
+            file=file
+        )
 
-            deleted_log_groups.append(log_group)
-            cloud_watch_client.delete_log_group(logGroupName=log_group)
 
-    return deleted_log_groups
+def run(args: Namespace) -> None:
+    cache = ClientCache()
+    targets = list(product(args.accounts or [None], args.regions or [None]))
+
+    with LogGroupDeleter(concurrency=args.concurrency, rate=args.rate, dry_run=args.dry_run) as deleter:
+        with ThreadPoolExecutor(max_workers=args.sweeps) as executor:
+            futures = [
+                executor.submit(sweep, cache, account, region, args.types, args.threads, deleter)
+                for account, region in targets
+            ]
+
+        sweeps = [future.result() for future in futures]
+
+    reports = get_report(sweeps)
 
+    print_report(reports)
+    deleter.summary.print()
 
-def run() -> None:
-    lambda_functions = get_all_functions()
-    code_build_projects = get_all_code_build_projects()
-    apig_apis = get_all_apis()
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"sweeps": reports, "summary": deleter.summary.to_dict()}, f, indent=4)
 
-    logger.info(delete_log_groups('/aws/lambda/', lambda_functions))
-    logger.info(delete_log_groups('/aws/codebuild/', code_build_projects))
-    logger.info(delete_log_groups('API-Gateway-Execution-Logs_', apig_apis, suffix='/.+'))
+    if any(report['error'] for report in reports):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
-    run()
+    parser = argparse.ArgumentParser(
+        description='Finds non-existing resources in AWS and deletes their LogGroups'
+    )
+
+    parser.add_argument('--accounts', nargs='+')
+    parser.add_argument('--regions', nargs='+')
+    parser.add_argument('--sweeps', type=int, default=8)
+    parser.add_argument('--report', type=str)
+    parser.add_argument('--types', nargs='+', choices=list(LOG_GROUPS), default=DEFAULT_TYPES)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=DELETE_LOG_GROUP_RATE)
+
+    args = parser.parse_args()
+
+    run(args)
@@ -0,0 +1,254 @@
+"""
+Deletes CloudWatch log groups concurrently while staying under the API quotas
+
+Deletions run on a bounded thread pool. Every client (so every account and region) has its own token bucket
+refilled at the DeleteLogGroup quota, 10 requests per second by default. When a call is throttled anyway the rate of
+that bucket is halved and the call is retried after an exponential backoff with jitter, the rate then grows back by
+a tenth of the quota per successful call. Connection errors and timeouts are retried with the same backoff.
+
+The clients given to the deleter should be created with DELETE_CLIENT_CONFIG so botocore does not retry throttled
+calls by itself, the deleter would otherwise only see the throttling once botocore gave up.
+
+Example:
+    client = session.client('logs', config=DELETE_CLIENT_CONFIG)
+
+    with LogGroupDeleter(concurrency=8, dry_run=True) as deleter:
+        for log_group in log_groups:
+            deleter.submit(client, log_group)
+
+    deleter.summary.print()
+"""
+import random
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from botocore.config import Config
+from botocore.exceptions import (BotoCoreError, ClientError, ConnectionError, ConnectTimeoutError, HTTPClientError,
+                                 ReadTimeoutError)
+
+# DeleteLogGroup quota per account and region, in requests per second
+DELETE_LOG_GROUP_RATE = 10.0
+# Single attempt, the retries and their backoff are left to the deleter
+DELETE_CLIENT_CONFIG = Config(retries={'total_max_attempts': 1, 'mode': 'standard'})
+THROTTLING_ERRORS = {'ThrottlingException', 'Throttling', 'TooManyRequestsException', 'RequestLimitExceeded'}
+# Transient errors of the connection, credentials or parameter errors are not retried
+RETRYABLE_ERRORS = (ConnectionError, HTTPClientError, ReadTimeoutError, ConnectTimeoutError)
+
+
+class TokenBucket(object):
+    """
+    This class limits the rate of calls, adapting it when they are throttled.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+        super().__init__()
+
+    def acquire(self) -> None:
+        """
+        Waits until a call is allowed
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def throttled(self) -> None:
+        with self.lock:
+            self.rate = max(self.max_rate / 20, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class DeletionSummary(object):
+    """
+    This class collects the outcome of the deletions.
+
+    Log groups are identified by their location (region, or account and region) along with their name since the same
+    name can be deleted in several of them.
+    """
+
+    def __init__(self, dry_run: bool = False) -> None:
+        self.dry_run = dry_run
+        self.deleted: List[Tuple[str, str]] = []
+        self.missing: List[Tuple[str, str]] = []
+        self.failed: Dict[Tuple[str, str], str] = {}
+        self.retried: Dict[Tuple[str, str], int] = {}
+        self.durations: List[float] = []
+        self.started = time.time()
+        self.elapsed = None
+        self.lock = threading.Lock()
+
+        super().__init__()
+
+    def add(self, location: str, log_group: str, status: str, duration: float, retries: int,
+            error: str = None) -> None:
+        with self.lock:
+            if status == 'deleted':
+                self.deleted.append((location, log_group))
+            elif status == 'missing':
+                self.missing.append((location, log_group))
+            else:
+                self.failed[(location, log_group)] = error
+
+            if retries:
+                self.retried[(location, log_group)] = retries
+
+            self.durations.append(duration)
+
+    def finish(self) -> None:
+        self.elapsed = time.time() - self.started
+
+    def to_dict(self) -> Dict:
+        durations = sorted(self.durations)
+
+        return {
+            "deleted": len(self.deleted),
+            "missing": len(self.missing),
+            "failed": [
+                {"location": location, "log_group": log_group, "error": error}
+                for (location, log_group), error in self.failed.items()
+            ],
+            "retried": len(self.retried),
+            "retries": sum(self.retried.values()),
+            "elapsed": self.elapsed,
+            "duration": {
+                "mean": sum(durations) / len(durations) if durations else None,
+                "p50": durations[len(durations) // 2] if durations else None,
+                "max": durations[-1] if durations else None
+            }
+        }
+
+    def print(self, file=None) -> None:
+        # Resolved on every call so a redirected sys.stdout is followed
+        file = file or sys.stdout
+        summary = self.to_dict()
+
+        print(
+            ('[Dry run] ' if self.dry_run else '') +
+            f"Deleted: {summary['deleted']}, already gone: {summary['missing']}, failed: {len(summary['failed'])}, "
+            f"retried: {summary['retried']} ({summary['retries']} retries) in {summary['elapsed'] or 0:.1f}s",
+            file=file
+        )
+
+        for failure in summary['failed']:
+            print(f"\tFailed: [{failure['location']}] {failure['log_group']}: {failure['error']}", file=file)
+
+
+class LogGroupDeleter(object):
+    """
+    This class deletes log groups on a thread pool with a rate limit per client.
+    """
+
+    def __init__(self, concurrency: int = 4, rate: float = DELETE_LOG_GROUP_RATE, max_retries: int = 8,
+                 base_delay: float = 0.5, max_delay: float = 20.0, dry_run: bool = False) -> None:
+        self.rate = rate
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dry_run = dry_run
+
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.buckets: Dict[int, Tuple[object, TokenBucket]] = {}
+        self.buckets_lock = threading.Lock()
+        self.summary = DeletionSummary(dry_run)
+
+        super().__init__()
+
+    def __enter__(self) -> 'LogGroupDeleter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def get_bucket(self, client) -> TokenBucket:
+        with self.buckets_lock:
+            # The client is kept along with its bucket so its id cannot be reused
+            if id(client) not in self.buckets:
+                self.buckets[id(client)] = (client, TokenBucket(self.rate))
+
+            return self.buckets[id(client)][1]
+
+    def submit(self, client, log_group: str, location: str = None) -> Future:
+        """
+        Schedules the deletion of a log group
+
+        :param client: Logs client of the account and region of the log group
+        :param log_group: Name of the log group
+        :param location: Where the log group is in the summary, defaults to the region of the client
+        :return: Future of the deletion status, 'deleted', 'missing' or 'failed'
+        """
+        return self.executor.submit(self.delete, client, log_group, location)
+
+    def backoff(self, retries: int) -> None:
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retries)))
+
+    def delete(self, client, log_group: str, location: str = None) -> str:
+        location = location or client.meta.region_name
+        bucket = self.get_bucket(client)
+        started = time.time()
+        retries = 0
+
+        if self.dry_run:
+            self.summary.add(location, log_group, 'deleted', 0.0, retries)
+            return 'deleted'
+
+        while True:
+            bucket.acquire()
+
+            try:
+                client.delete_log_group(logGroupName=log_group)
+            except BotoCoreError as e:
+                # Endpoint connection errors, read timeouts...
+                if isinstance(e, RETRYABLE_ERRORS) and retries < self.max_retries:
+                    retries += 1
+                    self.backoff(retries)
+                    continue
+
+                self.summary.add(location, log_group, 'failed', time.time() - started, retries, str(e))
+                return 'failed'
+            except ClientError as e:
+                code = e.response.get('Error', {}).get('Code')
+
+                if code == 'ResourceNotFoundException':
+                    self.summary.add(location, log_group, 'missing', time.time() - started, retries)
+                    return 'missing'
+
+                if code in THROTTLING_ERRORS and retries < self.max_retries:
+                    bucket.throttled()
+                    retries += 1
+                    self.backoff(retries)
+                    continue
+
+                self.summary.add(location, log_group, 'failed', time.time() - started, retries, str(e))
+                return 'failed'
+
+            bucket.succeeded()
+            self.summary.add(location, log_group, 'deleted', time.time() - started, retries)
+
+            return 'deleted'
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.summary.finish()
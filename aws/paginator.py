@@ -0,0 +1,97 @@
+"""
+Lazy pagination of boto3 list/describe calls
+
+Items are yielded page by page so only the current page (and the next one when prefetching) is held in memory.
+With prefetch the next page is requested on a background thread while the items of the current page are consumed,
+which hides the latency of the calls when the caller does some work per item.
+
+Operations boto3 has a paginator for go through it. Others, like logs get_log_events, are paginated by passing the
+output token back as the input token until it is missing or repeats.
+
+Example:
+    for log_group in paginate(client, 'describe_log_groups', logGroupNamePrefix='/aws/lambda/'):
+        print(log_group['logGroupName'])
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator
+
+# Pages are fetched in a background thread, this is returned once there are none left
+END = object()
+
+
+def prefetch_pages(pages: Iterator[Dict]) -> Iterator[Dict]:
+    """
+    Requests the next page while the current one is being consumed
+
+    :param pages: Pages to prefetch
+    :return: Same pages
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(next, pages, END)
+
+        while True:
+            page = future.result()
+
+            if page is END:
+                return
+
+            future = executor.submit(next, pages, END)
+
+            yield page
+
+
+def get_token_pages(client, operation: str, input_token: str, output_token: str, **parameters) -> Iterator[Dict]:
+    method = getattr(client, operation)
+    token = None
+
+    while True:
+        page = method(**parameters, **({input_token: token} if token is not None else {}))
+
+        yield page
+
+        # Some operations keep returning the token they were given once there is nothing left
+        if page.get(output_token) is None or page[output_token] == token:
+            return
+
+        token = page[output_token]
+
+
+def get_pages(client, operation: str, prefetch: bool = False, input_token: str = None, output_token: str = None,
+              **parameters) -> Iterator[Dict]:
+    """
+    Gets the pages of a call
+
+    :param client: boto3 client
+    :param operation: Name of the client method
+    :param prefetch: Whether the next page is requested while the current one is consumed
+    :param input_token: Parameter the token is sent in, only for operations boto3 has no paginator for
+    :param output_token: Response key the next token is read from, only for operations boto3 has no paginator for
+    :param parameters: Parameters of the call
+    :return: Responses of the call
+    """
+    if client.can_paginate(operation):
+        pages = iter(client.get_paginator(operation).paginate(**parameters))
+    else:
+        input_token = input_token or 'nextToken'
+        pages = get_token_pages(client, operation, input_token, output_token or input_token, **parameters)
+
+    return prefetch_pages(pages) if prefetch else pages
+
+
+def paginate(client, operation: str, result_key: str = None, prefetch: bool = False, **parameters) -> Iterator[Any]:
+    """
+    Gets the items of every page of a call
+
+    :param client: boto3 client
+    :param operation: Name of the client method
+    :param result_key: Response key holding the items, defaults to the result key of the boto3 paginator
+    :param prefetch: Whether the next page is requested while the current one is consumed
+    :param parameters: Parameters of the call, plus input_token and output_token for operations boto3 has no
+                       paginator for
+    :return: Items of the call
+    """
+    if result_key is None:
+        result_key = client.get_paginator(operation).paginate().result_keys[0].expression
+
+    for page in get_pages(client, operation, prefetch, **parameters):
+        yield from page.get(result_key, [])
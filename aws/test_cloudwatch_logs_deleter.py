@@ -0,0 +1,126 @@
+"""
+Tests of the concurrent region search of cloudwatch_logs_deleter against Stubber responses
+
+Usage:
+    python -m pytest test_cloudwatch_logs_deleter.py
+"""
+from argparse import Namespace
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+import cloudwatch_logs_deleter
+from cloudwatch_logs_deleter import get_clients, get_literal_prefix, search_regions
+
+
+@pytest.fixture(autouse=True)
+def credentials(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+@pytest.mark.parametrize('pattern, prefix', [
+    ('^/aws/lambda/test', '/aws/lambda/test'),
+    (r'^a\.b', 'a.b'),
+    ('^ab?', 'a'),
+    ('^ab*c', 'a'),
+    ('^a|^b', ''),
+    ('(?i)^x', ''),
+    ('^a+', ''),
+    ('aws', ''),
+    ('', ''),
+])
+def test_get_literal_prefix(pattern, prefix):
+    assert get_literal_prefix(pattern) == prefix
+
+
+def get_stubbed_clients(regions):
+    clients = get_clients(regions)
+    stubbers = {region: Stubber(client) for region, client in clients.items()}
+
+    for stubber in stubbers.values():
+        stubber.activate()
+
+    return clients, stubbers
+
+
+def add_log_group_pages(stubber: Stubber) -> None:
+    # The literal prefix of the pattern is sent with every page, the rest of the pattern is matched on the names
+    stubber.add_response(
+        'describe_log_groups',
+        {'logGroups': [{'logGroupName': '/aws/lambda/test-a'}, {'logGroupName': '/aws/lambda/test-zz'}],
+         'nextToken': 'token'},
+        {'logGroupNamePrefix': '/aws/lambda/test-'}
+    )
+    stubber.add_response(
+        'describe_log_groups',
+        {'logGroups': [{'logGroupName': '/aws/lambda/test-b'}]},
+        {'logGroupNamePrefix': '/aws/lambda/test-', 'nextToken': 'token'}
+    )
+
+
+def test_search_regions_streams_matches_and_errors():
+    clients, stubbers = get_stubbed_clients(['us-east-1', 'ap-northeast-1'])
+    add_log_group_pages(stubbers['us-east-1'])
+    stubbers['ap-northeast-1'].add_client_error(
+        'describe_log_groups', 'UnrecognizedClientException', 'The security token included in the request is invalid'
+    )
+
+    results = list(search_regions('^/aws/lambda/test-[ab]$', clients, threads=2))
+
+    matches = [(region, result) for region, result in results if not isinstance(result, Exception)]
+    errors = [(region, result) for region, result in results if isinstance(result, Exception)]
+
+    assert matches == [('us-east-1', '/aws/lambda/test-a'), ('us-east-1', '/aws/lambda/test-b')]
+    assert len(errors) == 1
+    assert errors[0][0] == 'ap-northeast-1'
+    assert isinstance(errors[0][1], ClientError)
+    assert errors[0][1].response['Error']['Code'] == 'UnrecognizedClientException'
+
+    for stubber in stubbers.values():
+        stubber.assert_no_pending_responses()
+
+
+def test_search_without_anchor_lists_every_log_group():
+    clients, stubbers = get_stubbed_clients(['us-east-1'])
+    stubbers['us-east-1'].add_response(
+        'describe_log_groups', {'logGroups': [{'logGroupName': '/aws/lambda/x'}, {'logGroupName': 'other'}]}, {}
+    )
+
+    assert list(search_regions('lambda', clients)) == [('us-east-1', '/aws/lambda/x')]
+    stubbers['us-east-1'].assert_no_pending_responses()
+
+
+def test_run_deletes_matches_of_every_region(monkeypatch, capsys):
+    search_clients, search_stubbers = get_stubbed_clients(['us-east-1', 'ap-northeast-1'])
+    delete_clients, delete_stubbers = get_stubbed_clients(['us-east-1', 'ap-northeast-1'])
+
+    for region in search_clients:
+        search_stubbers[region].add_response(
+            'describe_log_groups', {'logGroups': [{'logGroupName': '/aws/lambda/test'}]},
+            {'logGroupNamePrefix': '/aws/lambda/test'}
+        )
+
+    delete_stubbers['us-east-1'].add_response('delete_log_group', {}, {'logGroupName': '/aws/lambda/test'})
+    delete_stubbers['ap-northeast-1'].add_client_error('delete_log_group', 'ResourceNotFoundException')
+
+    monkeypatch.setattr(
+        cloudwatch_logs_deleter, 'get_clients',
+        lambda regions, config=None: delete_clients if config is not None else search_clients
+    )
+
+    cloudwatch_logs_deleter.run(Namespace(
+        name='^/aws/lambda/test', regions=['us-east-1', 'ap-northeast-1'], threads=2, delete=True, dry_run=False,
+        concurrency=2, rate=10.0
+    ))
+
+    output = capsys.readouterr().out
+
+    assert '[us-east-1]\t/aws/lambda/test' in output
+    assert '[ap-northeast-1]\t/aws/lambda/test' in output
+    assert 'Deleted: 1, already gone: 1, failed: 0' in output
+
+    for stubber in [*search_stubbers.values(), *delete_stubbers.values()]:
+        stubber.assert_no_pending_responses()
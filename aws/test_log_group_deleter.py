@@ -0,0 +1,55 @@
+"""
+Tests of the retries of log_group_deleter on the errors raised by the client
+
+Usage:
+    python -m pytest test_log_group_deleter.py
+"""
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import EndpointConnectionError, NoCredentialsError, ParamValidationError, ReadTimeoutError
+
+from log_group_deleter import LogGroupDeleter
+
+
+class FailingClient(object):
+    """
+    This class stands for a logs client whose deletions raise the given errors before succeeding.
+    """
+
+    def __init__(self, *errors: Exception) -> None:
+        self.errors = list(errors)
+        self.calls = 0
+        self.meta = SimpleNamespace(region_name='us-east-1')
+
+        super().__init__()
+
+    def delete_log_group(self, logGroupName: str) -> dict:
+        self.calls += 1
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return {}
+
+
+@pytest.mark.parametrize('error', [
+    EndpointConnectionError(endpoint_url='https://logs.us-east-1.amazonaws.com'),
+    ReadTimeoutError(endpoint_url='https://logs.us-east-1.amazonaws.com'),
+])
+def test_connection_errors_are_retried(error):
+    client = FailingClient(error, error)
+    deleter = LogGroupDeleter(base_delay=0.0, max_delay=0.0)
+
+    assert deleter.delete(client, '/aws/lambda/a') == 'deleted'
+    assert client.calls == 3
+
+
+@pytest.mark.parametrize('error', [NoCredentialsError(), ParamValidationError(report='Invalid logGroupName')])
+def test_other_errors_fail_immediately(error):
+    client = FailingClient(error)
+    deleter = LogGroupDeleter(base_delay=0.0, max_delay=0.0)
+
+    assert deleter.delete(client, '/aws/lambda/a') == 'failed'
+    assert client.calls == 1
+    assert deleter.summary.to_dict()['failed'][0]['error'] == str(error)
@@ -0,0 +1,161 @@
+"""
+Tests of the lazy pagination layer against Stubber-recorded multi-page responses
+
+Usage:
+    python -m pytest test_paginator.py
+"""
+import time
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+import cloudwatch_get_logs
+from cloudwatch_logs_missing_resource_logs_deleter import ApiGatewayLogGroup, LambdaLogGroup
+from paginator import get_pages, paginate
+
+
+@pytest.fixture(autouse=True)
+def credentials(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+def get_stubbed_client(service: str):
+    client = boto3.session.Session().client(service)
+    stubber = Stubber(client)
+    stubber.activate()
+
+    return client, stubber
+
+
+def add_log_group_pages(stubber: Stubber) -> None:
+    stubber.add_response(
+        'describe_log_groups',
+        {'logGroups': [{'logGroupName': '/aws/a'}, {'logGroupName': '/aws/b'}], 'nextToken': 'token'},
+        {'logGroupNamePrefix': '/aws/'}
+    )
+    stubber.add_response(
+        'describe_log_groups',
+        {'logGroups': [{'logGroupName': '/aws/c'}]},
+        {'logGroupNamePrefix': '/aws/', 'nextToken': 'token'}
+    )
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_paginate_follows_boto3_paginator(prefetch):
+    client, stubber = get_stubbed_client('logs')
+    add_log_group_pages(stubber)
+
+    log_groups = paginate(client, 'describe_log_groups', prefetch=prefetch, logGroupNamePrefix='/aws/')
+
+    assert [log_group['logGroupName'] for log_group in log_groups] == ['/aws/a', '/aws/b', '/aws/c']
+    stubber.assert_no_pending_responses()
+
+
+def test_paginate_is_lazy():
+    client, stubber = get_stubbed_client('logs')
+    add_log_group_pages(stubber)
+
+    log_groups = paginate(client, 'describe_log_groups', logGroupNamePrefix='/aws/')
+
+    assert next(log_groups)['logGroupName'] == '/aws/a'
+
+    # The second page is only requested once the first one is consumed
+    with pytest.raises(AssertionError):
+        stubber.assert_no_pending_responses()
+
+
+def test_prefetch_requests_the_next_page_while_the_current_one_is_consumed():
+    client, stubber = get_stubbed_client('logs')
+    add_log_group_pages(stubber)
+
+    pages = get_pages(client, 'describe_log_groups', prefetch=True, logGroupNamePrefix='/aws/')
+    first = next(pages)
+
+    assert [log_group['logGroupName'] for log_group in first['logGroups']] == ['/aws/a', '/aws/b']
+
+    # The second page is requested in the background before it is asked for
+    deadline = time.time() + 5
+
+    while True:
+        try:
+            stubber.assert_no_pending_responses()
+            break
+        except AssertionError:
+            if time.time() > deadline:
+                raise
+
+            time.sleep(0.01)
+    assert [log_group['logGroupName'] for page in pages for log_group in page['logGroups']] == ['/aws/c']
+
+
+def get_event(message: str) -> dict:
+    return {'timestamp': 1, 'message': message, 'ingestionTime': 2}
+
+
+def add_log_event_pages(stubber: Stubber, expected: dict) -> None:
+    stubber.add_response('get_log_events', {'events': [get_event('1')], 'nextForwardToken': 'f/1'}, expected)
+    stubber.add_response(
+        'get_log_events', {'events': [get_event('2')], 'nextForwardToken': 'f/2'}, {**expected, 'nextToken': 'f/1'}
+    )
+    # The end of the stream is reached when the token given is returned again
+    stubber.add_response('get_log_events', {'events': [], 'nextForwardToken': 'f/2'}, {**expected, 'nextToken': 'f/2'})
+
+
+def test_paginate_stops_when_the_token_repeats():
+    client, stubber = get_stubbed_client('logs')
+    expected = {'logGroupName': 'group', 'logStreamName': 'stream', 'startFromHead': True}
+    add_log_event_pages(stubber, expected)
+
+    events = paginate(
+        client, 'get_log_events', 'events', input_token='nextToken', output_token='nextForwardToken', **expected
+    )
+
+    assert [event['message'] for event in events] == ['1', '2']
+    stubber.assert_no_pending_responses()
+
+
+def test_paginate_stops_when_the_token_is_missing():
+    client, stubber = get_stubbed_client('logs')
+    stubber.add_response('get_log_events', {'events': [get_event('1')]}, {'logGroupName': 'g', 'logStreamName': 's'})
+
+    events = paginate(
+        client, 'get_log_events', 'events', input_token='nextToken', output_token='nextForwardToken',
+        logGroupName='g', logStreamName='s'
+    )
+
+    assert [event['message'] for event in events] == ['1']
+    stubber.assert_no_pending_responses()
+
+
+def test_get_log_events_reads_forward_from_the_oldest_event(monkeypatch):
+    client, stubber = get_stubbed_client('logs')
+    add_log_event_pages(stubber, {
+        'logGroupName': 'group', 'logStreamName': 'stream', 'startTime': ANY, 'endTime': ANY, 'startFromHead': True
+    })
+    monkeypatch.setattr(cloudwatch_get_logs, 'boto_client', lambda service: client)
+
+    events = cloudwatch_get_logs.get_log_events('group', 'stream')
+
+    assert [event.message for event in events] == ['1', '2']
+    stubber.assert_no_pending_responses()
+
+
+def test_lambda_functions_follow_next_marker():
+    client, stubber = get_stubbed_client('lambda')
+    stubber.add_response('list_functions', {'Functions': [{'FunctionName': 'a'}], 'NextMarker': 'marker'}, {})
+    stubber.add_response('list_functions', {'Functions': [{'FunctionName': 'b'}]}, {'Marker': 'marker'})
+
+    assert LambdaLogGroup(client, None).get_resources() == {'a', 'b'}
+    stubber.assert_no_pending_responses()
+
+
+def test_rest_apis_follow_position():
+    client, stubber = get_stubbed_client('apigateway')
+    stubber.add_response('get_rest_apis', {'items': [{'id': 'a'}], 'position': 'next'}, {})
+    stubber.add_response('get_rest_apis', {'items': [{'id': 'b'}]}, {'position': 'next'})
+
+    assert ApiGatewayLogGroup(client, None).get_resources() == {'a', 'b'}
+    stubber.assert_no_pending_responses()
@@ -0,0 +1,216 @@
+"""
+Compares the original recursive, deepcopy-based traversal of traverse_dict_list.Encode with the iterative one, and
+the original regex-per-call Encode.parse_string with the precompiled one, and the generic traversal with the
+schema-learning batch mode on a list of records of the same shape
+
+A nested JSON document of roughly the requested size is generated in memory: a list of records holding nested dicts
+and lists of numeric and non-numeric strings. Each traversal gets its own freshly parsed copy of the document since
+the in-place mode modifies it.
+
+A deeply nested list is converted as well to show the recursion limit of the original traversal. It is built
+directly since the json module cannot parse it either.
+
+parse_string is timed on a list of strings that are mostly not numbers, like the string values of a DynamoDB export.
+The benchmark fails if the speedup is below --min-speedup so it can be used as a check.
+
+Parameters:
+    --size Approximate size of the generated document in MB
+    --depth Nesting depth of the deeply nested document
+    --strings Number of strings parsed by the parse_string benchmark
+    --numeric-ratio Fraction of these strings that are numbers
+    --min-speedup Smallest parse_string speedup accepted
+    --records Number of records converted by the batch benchmark
+
+Usage:
+    python benchmark_encode.py --size 50 --depth 100000
+"""
+import argparse
+import json
+import random
+import re
+import time
+from copy import deepcopy
+from typing import Any, Callable, Dict, List
+
+from traverse_dict_list import Encode
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'us-east-1', 'ACTIVE', 'arn:aws:lambda', '']
+
+
+def original_parse_string(string: str) -> [str, int, float]:
+    if re.match(r'\d+\.\d+', string):
+        return float(string)
+    elif re.match(r'\d+', string):
+        return int(string)
+
+    return string
+
+
+class RecursiveEncode(object):
+    """
+    Traversal of Encode before it was made iterative, kept for comparison.
+    """
+
+    @staticmethod
+    def traverse_dict(d: Dict) -> Dict:
+        d_c: Dict = deepcopy(d)
+
+        for key, value in d_c.items():
+            d_c[key] = RecursiveEncode.guess_encode(value)
+
+        return d_c
+
+    @staticmethod
+    def traverse_list(l: List) -> List:
+        l_c = deepcopy(l)
+
+        for idx, item in enumerate(l_c):
+            l_c[idx] = RecursiveEncode.guess_encode(item)
+
+        return l_c
+
+    @staticmethod
+    def guess_encode(obj: Any) -> Any:
+        if isinstance(obj, Dict):
+            return RecursiveEncode.traverse_dict(obj)
+        elif isinstance(obj, List):
+            return RecursiveEncode.traverse_list(obj)
+        elif isinstance(obj, str):
+            return Encode.parse_string(obj)
+
+
+def get_value() -> str:
+    if random.random() < 0.5:
+        return random.choice(WORDS)
+
+    if random.random() < 0.5:
+        return str(random.randrange(100000))
+
+    return f'{random.uniform(0, 1000):.3f}'
+
+
+def get_record(depth: int = 4) -> Dict:
+    record = {f'field_{index}': get_value() for index in range(4)}
+
+    if depth:
+        record['children'] = [get_record(depth - 1) for _ in range(2)]
+        record['tags'] = [get_value() for _ in range(3)]
+
+    return record
+
+
+def generate_document(size: int) -> str:
+    record = json.dumps(get_record())
+    records = [get_record() for _ in range(size * 1024 * 1024 // len(record))]
+
+    return json.dumps(records)
+
+
+def generate_nested(depth: int) -> List:
+    nested = ['1']
+
+    for _ in range(depth):
+        nested = [nested]
+
+    return nested
+
+
+def time_traversal(load: Callable[[], Any], function: Callable) -> str:
+    obj = load()
+
+    start = time.time()
+
+    try:
+        function(obj)
+    except RecursionError:
+        return 'RecursionError'
+
+    return f'{time.time() - start:.2f}s'
+
+
+def get_flat_record(index: int) -> Dict:
+    return {
+        'id': str(index),
+        'name': random.choice(WORDS),
+        'price': f'{random.uniform(0, 1000):.2f}',
+        'quantity': str(random.randrange(100)),
+        'active': random.random() < 0.5,
+        # Text starting with a digit, which must not be mistaken for a number
+        'date': f'2024-{random.randrange(1, 13):02d}-{random.randrange(1, 29):02d}',
+        'phone': f'{random.randrange(100, 1000)}-{random.randrange(1000, 10000)}',
+        'location': {'region': 'us-east-1', 'zone': random.choice(WORDS), 'rack': str(random.randrange(40))},
+    }
+
+
+def time_parse_string(strings: List[str], function: Callable[[str], Any], repeat: int = 3) -> float:
+    took = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+
+        for string in strings:
+            function(string)
+
+        took.append(time.perf_counter() - start)
+
+    return min(took)
+
+
+def batch_in_place(records: List) -> List:
+    return Encode.encode_batch(records, in_place=True)
+
+
+def run(args: argparse.Namespace) -> None:
+    traversals = [
+        ('recursive + deepcopy', RecursiveEncode.guess_encode),
+        ('iterative', Encode.guess_encode),
+        ('iterative in place', lambda obj: Encode.guess_encode(obj, in_place=True)),
+    ]
+
+    document = generate_document(args.size)
+    print(f'[document] {len(document) / 1024 / 1024:.0f}MB')
+
+    for name, function in traversals:
+        print(f'\t {name}: {time_traversal(lambda: json.loads(document), function)}')
+
+    print(f'[nested] depth {args.depth}')
+
+    for name, function in traversals:
+        print(f'\t {name}: {time_traversal(lambda: generate_nested(args.depth), function)}')
+
+    # Numbers the original parser understands so both parsers do the same work
+    strings = [
+        str(random.randrange(100000)) if random.random() < args.numeric_ratio else random.choice(WORDS)
+        for _ in range(args.strings)
+    ]
+    print(f'[parse_string] {args.strings} strings, {args.numeric_ratio:.0%} numeric')
+
+    original = time_parse_string(strings, original_parse_string)
+    precompiled = time_parse_string(strings, Encode.parse_string)
+
+    print(f'\t original: {original:.2f}s')
+    print(f'\t precompiled: {precompiled:.2f}s ({original / precompiled:.1f}x)')
+
+    if original / precompiled < args.min_speedup:
+        raise SystemExit(f'parse_string is {original / precompiled:.1f}x faster, expected {args.min_speedup}x')
+
+    records = json.dumps([get_flat_record(index) for index in range(args.records)])
+    print(f'[batch] {args.records} records')
+
+    print(f'\t generic in place: {time_traversal(lambda: json.loads(records), traversals[2][1])}')
+    print(f'\t batch in place: {time_traversal(lambda: json.loads(records), batch_in_place)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the recursive and iterative traversals of Encode')
+
+    parser.add_argument('--size', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=100000)
+    parser.add_argument('--strings', type=int, default=1000000)
+    parser.add_argument('--numeric-ratio', type=float, default=0.1)
+    parser.add_argument('--min-speedup', type=float, default=5.0)
+    parser.add_argument('--records', type=int, default=1000000)
+
+    args = parser.parse_args()
+
+    run(args)
@@ -0,0 +1,3 @@
+"""
+Makes the python_duplicate package importable when pytest is run from the root of the repository
+"""
@@ -0,0 +1,239 @@
+"""
+Converts the string numbers of every record of a large JSON file with traverse_dict_list.Encode
+
+The input is read record by record, either one record per line (NDJSON) or a top-level JSON array, so only the
+records in flight are held in memory. Chunks of records are converted on a process pool and written to the output in
+the input order, as NDJSON for NDJSON input and as a JSON array for array input.
+
+Parameters:
+    --input NDJSON file or file holding a top-level JSON array
+    --output File where the converted records are written
+    --format 'auto' detects a top-level array from the first character, 'ndjson' or 'array' force the format
+    --processes Number of worker processes, records are converted in the main process if 1
+    --chunk-size Number of records sent to a worker per task
+    --decimal 'float' converts numbers with a fraction or an exponent, 'str' leaves them as strings
+
+Usage:
+    python encode_stream.py --input export.json --output converted.json --processes 8
+"""
+import argparse
+import json
+import math
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterable, Iterator, List, TextIO
+
+from traverse_dict_list import Encode
+
+READ_SIZE = 1024 * 1024
+# JSON whitespace and the characters that may follow an array item
+DELIMITERS = frozenset(' \t\n\r,]')
+
+
+def finite_float(string: str):
+    # Strings overflowing a float ("1e999") are kept, json cannot write Infinity
+    value = float(string)
+
+    return value if math.isfinite(value) else string
+
+
+DECIMALS = {'float': finite_float, 'str': str}
+
+
+def detect_format(f: TextIO) -> str:
+    while True:
+        character = f.read(1)
+
+        if not character:
+            return 'ndjson'
+
+        if not character.isspace():
+            f.seek(0)
+
+            return 'array' if character == '[' else 'ndjson'
+
+
+def read_lines(f: TextIO) -> Iterator[str]:
+    for line in f:
+        if line.strip():
+            yield line
+
+
+def read_array(f: TextIO) -> Iterator[str]:
+    """
+    Reads the items of a top-level JSON array one at a time
+
+    :param f: File positioned before the opening bracket
+    :return: JSON text of every item
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skips the whitespace, the opening bracket and the commas between items
+        while position < len(buffer):
+            character = buffer[position]
+
+            if character.isspace() or character == ',' and started:
+                position += 1
+            elif character == '[' and not started:
+                started = True
+                position += 1
+            elif not started:
+                raise ValueError('Not a JSON array')
+            else:
+                break
+
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        if position < len(buffer):
+            try:
+                _, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+
+                end = None
+
+            # A number is only complete once a delimiter follows it, "12." may continue as "12.5" in the next read
+            if end is not None and (end < len(buffer) and buffer[end] in DELIMITERS or eof):
+                yield buffer[position:end]
+
+                position = end
+                continue
+
+        if eof:
+            if started:
+                raise ValueError('Unterminated JSON array')
+
+            return
+
+        data = f.read(READ_SIZE)
+        eof = not data
+        buffer = buffer[position:] + data
+        position = 0
+
+
+def encode_records(records: List[str], decimal: str = 'float') -> List[str]:
+    # Restored afterwards so converting in this process (--processes 1) does not change Encode for other callers
+    previous, Encode.DECIMAL = Encode.DECIMAL, DECIMALS[decimal]
+
+    try:
+        converted = Encode.encode_batch([json.loads(record) for record in records], in_place=True)
+    finally:
+        Encode.DECIMAL = previous
+
+    return [json.dumps(record, allow_nan=False) for record in converted]
+
+
+def chunked(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+
+    for item in items:
+        chunk.append(item)
+
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def encode_chunks(chunks: Iterable[List[str]], processes: int = None, decimal: str = 'float') -> Iterator[List[str]]:
+    """
+    Converts chunks of records on a process pool and yields them in order
+
+    At most two chunks per worker are in flight so memory stays flat regardless of the size of the input.
+
+    :param chunks: JSON text of the records
+    :param processes: Number of worker processes, defaults to the CPU count, converted in this process if 1
+    :param decimal: Conversion of numbers with a fraction or an exponent, see DECIMALS
+    :return: JSON text of the converted records, chunk by chunk
+    """
+    processes = processes or os.cpu_count()
+
+    if processes == 1:
+        for chunk in chunks:
+            yield encode_records(chunk, decimal)
+
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending: Deque[Future] = deque()
+
+        for chunk in chunks:
+            if len(pending) >= processes * 2:
+                yield pending.popleft().result()
+
+            pending.append(executor.submit(encode_records, chunk, decimal))
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def encode_file(input_path: str, output_path: str, file_format: str = 'auto', processes: int = None,
+                chunk_size: int = 1000, decimal: str = 'float') -> int:
+    """
+    Converts every record of a NDJSON file or of a file holding a top-level JSON array
+
+    :param input_path: File to read
+    :param output_path: File to write, in the same format as the input
+    :param file_format: 'auto', 'ndjson' or 'array'
+    :param processes: Number of worker processes, defaults to the CPU count, converted in this process if 1
+    :param chunk_size: Number of records sent to a worker per task
+    :param decimal: Conversion of numbers with a fraction or an exponent, see DECIMALS
+    :return: Number of records written
+    """
+    written = 0
+
+    with open(input_path, 'r') as source, open(output_path, 'w') as output:
+        if file_format == 'auto':
+            file_format = detect_format(source)
+
+        records = read_array(source) if file_format == 'array' else read_lines(source)
+
+        if file_format == 'array':
+            output.write('[')
+
+        for chunk in encode_chunks(chunked(records, chunk_size), processes, decimal):
+            if file_format == 'array':
+                output.write((',\n' if written else '\n') + ',\n'.join(chunk))
+            else:
+                output.write(''.join(record + '\n' for record in chunk))
+
+            written += len(chunk)
+
+        if file_format == 'array':
+            output.write('\n]\n')
+
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts the string numbers of every record of a JSON file')
+
+    parser.add_argument('--input', type=str, required=True)
+    parser.add_argument('--output', type=str, required=True)
+    parser.add_argument('--format', choices=['auto', 'ndjson', 'array'], default='auto')
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--decimal', choices=list(DECIMALS), default='float')
+
+    args = parser.parse_args()
+
+    count = encode_file(
+        args.input,
+        args.output,
+        file_format=args.format,
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+        decimal=args.decimal
+    )
+
+    print(f'Converted {count} records')
@@ -0,0 +1,111 @@
+"""
+Compares the process-per-file hashing of the original data sharing scripts with the memory-mapped thread pool backend
+
+Two workloads are generated in a temporary directory to approximate different storage:
+    ssd  Many small files, latency per file dominates
+    hdd  Few large files, sequential throughput dominates
+
+The files are written right before hashing so they are likely served from the page cache, the numbers compare the
+per-file overhead of each approach rather than the raw speed of the disk.
+
+Parameters:
+    --workloads Workloads to run, ssd and/or hdd
+    --threads Number of threads for the thread pool backend
+
+Usage:
+    python benchmark_hashing.py --workloads ssd hdd --threads 16
+"""
+import argparse
+import functools
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from file_hashing import hash_files, mmap_digest
+
+WORKLOADS = {
+    'ssd': {'files': 2000, 'sizes': [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024]},
+    'hdd': {'files': 16, 'sizes': [32 * 1024 * 1024, 64 * 1024 * 1024]},
+}
+
+
+def generate_files(directory: str, files: int, sizes: List[int]) -> List[str]:
+    paths = []
+
+    for index in range(files):
+        path = os.path.join(directory, f'{index}.bin')
+
+        with open(path, 'wb') as f:
+            f.write(os.urandom(sizes[index % len(sizes)]))
+
+        paths.append(path)
+
+    return paths
+
+
+def process(file: str, db: Dict) -> None:
+    md5_digest = hashlib.md5(open(file, 'rb').read()).hexdigest()
+
+    if md5_digest in db:
+        db[md5_digest] += [file]
+    else:
+        db[md5_digest] = [file]
+
+
+def process_per_file(files: List[str]) -> None:
+    with multiprocessing.Manager() as manager:
+        data = manager.dict({})
+
+        procs = []
+        for file in files:
+            proc = multiprocessing.Process(target=process, args=(file, data))
+            proc.start()
+
+            procs.append(proc)
+
+        for p in procs:
+            p.join()
+
+
+def thread_pool(files: List[str], threads: int = None) -> None:
+    data = {}
+
+    for file, md5_digest, _ in hash_files(files, mmap_digest, threads=threads):
+        data.setdefault(md5_digest, []).append(file)
+
+
+def run(args: argparse.Namespace) -> None:
+    for workload in args.workloads:
+        with tempfile.TemporaryDirectory() as directory:
+            files = generate_files(directory, **WORKLOADS[workload])
+            total = sum(os.path.getsize(file) for file in files) / 1024 / 1024
+
+            print(f'[{workload}] {len(files)} files, {total:.0f}MB')
+
+            backends = [
+                ('process per file', process_per_file),
+                ('thread pool + mmap', functools.partial(thread_pool, threads=args.threads)),
+            ]
+
+            for name, function in backends:
+                start = time.time()
+                function(files)
+                took = time.time() - start
+
+                print(f'\t {name}: {took:.2f}s ({len(files) / took:.0f} files/s, {total / took:.0f}MB/s)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compares process-per-file hashing with the memory-mapped thread pool backend'
+    )
+
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--threads', type=int, default=None)
+
+    args = parser.parse_args()
+
+    run(args)
@@ -1,39 +1,165 @@
 """
 Test Python's Multiprocessing with data sharing across processes
 
-Reads all the files in a directory and stores their md5 hash on list
+Finds the files in a directory with identical contents and prints their hash with the list of files. Files are
+narrowed down in stages so most of them are never read fully:
+    1. Files are grouped by size and unique sizes are dropped
+    2. The first and last 64 KiB of the remaining files are hashed and unique partial hashes are dropped
+    3. The files that still collide are hashed fully, memory-mapped or streamed in fixed-size chunks
+
+Parameters:
+    --directory Directory to search for duplicates
+    --algorithm Hash algorithm, one of md5, sha1 or blake2b
+    --backend 'process' hashes on a process pool (default), 'thread' on a thread pool
+    --workers Number of processes or threads (defaults to the pool's default)
+
+Usage:
+    python data_sharing.py --directory /path --algorithm blake2b
 """
+import argparse
+import functools
 import hashlib
 import json
 import multiprocessing
 import os
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from file_hashing import ALGORITHMS, hash_files, mmap_digest, print_throughput, try_digest
+
+EDGE_SIZE = 64 * 1024
+
+
+def get_file_sizes(directory: str) -> Iterable[Tuple[str, int]]:
+    for current_dir, folders, files in os.walk(directory):
+        for file in files:
+            full_path = os.path.join(current_dir, file)
+
+            try:
+                yield full_path, os.stat(full_path).st_size
+            except OSError:
+                continue
+
+
+def get_collisions(groups: Dict) -> Dict:
+    return {key: files for key, files in groups.items() if len(files) > 1}
+
+
+def partial_digest(file: str, algorithm: str = 'md5') -> Tuple[str, str, int]:
+    """
+    Hashes the first and last EDGE_SIZE bytes of a file, files smaller than both edges are hashed fully
+
+    :param file: Path of the file
+    :param algorithm: Name of the hashlib algorithm
+    :return: Path of the file, hex digest and number of bytes read
+    """
+    digest = hashlib.new(algorithm)
+
+    with open(file, 'rb') as f:
+        head = f.read(EDGE_SIZE)
+        digest.update(head)
+
+        if os.fstat(f.fileno()).st_size <= EDGE_SIZE * 2:
+            tail = f.read()
+        else:
+            f.seek(-EDGE_SIZE, os.SEEK_END)
+            tail = f.read(EDGE_SIZE)
+
+        digest.update(tail)
+
+    return file, digest.hexdigest(), len(head) + len(tail)
+
+
+def digest_files(function: Callable, files: Iterable[str], algorithm: str = 'md5', backend: str = 'process',
+                 workers: int = None, chunksize: int = 1) -> Iterator[Tuple[str, str, int]]:
+    """
+    Hashes files on a process pool or on a thread pool
+
+    :param function: Function hashing one file
+    :param files: Paths of the files
+    :param algorithm: Name of the hashlib algorithm
+    :param backend: Either 'process' or 'thread'
+    :param workers: Number of processes or threads
+    :param chunksize: Number of files sent to a process per task
+    :return: Path, hex digest and number of bytes read of every file, files that cannot be read are skipped
+    """
+    if backend == 'thread':
+        yield from hash_files(files, function, algorithm=algorithm, threads=workers)
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        task = functools.partial(try_digest, function, algorithm=algorithm)
+
+        for result in pool.imap_unordered(task, files, chunksize=chunksize):
+            if result is not None:
+                yield result
+
+
+def find_duplicates(directory: str, algorithm: str = 'md5', backend: str = 'process',
+                    workers: int = None) -> Tuple[Dict[str, List], Dict]:
+    """
+    Finds the files with identical contents
+
+    :param directory: Directory to search for duplicates
+    :param algorithm: Name of the hashlib algorithm
+    :param backend: Either 'process' or 'thread'
+    :param workers: Number of processes or threads
+    :return: Digests mapped to the files having them and statistics on the bytes read
+    """
+    stats = {'files': 0, 'bytes_total': 0, 'bytes_read': 0}
+
+    sizes = defaultdict(list)
+
+    for file, size in get_file_sizes(directory):
+        sizes[size].append(file)
+
+        stats['files'] += 1
+        stats['bytes_total'] += size
+
+    file_sizes = {file: size for size, files in get_collisions(sizes).items() for file in files}
+
+    partials = defaultdict(list)
+    duplicates = defaultdict(list)
+
+    for file, digest, read in digest_files(partial_digest, file_sizes, algorithm, backend, workers, chunksize=16):
+        partials[(file_sizes[file], digest)].append(file)
+        stats['bytes_read'] += read
+
+    remaining = []
+
+    for (size, digest), files in get_collisions(partials).items():
+        # The partial digest already covered the whole file
+        if size <= EDGE_SIZE * 2:
+            duplicates[digest] += files
+        else:
+            remaining += files
 
-DIRECTORY = ''
+    fulls = defaultdict(list)
 
+    for file, digest, read in digest_files(mmap_digest, remaining, algorithm, backend, workers):
+        fulls[digest].append(file)
+        stats['bytes_read'] += read
 
-def process(file: str, db) -> None:
-    md5_digest = hashlib.md5(open(file, 'rb').read()).hexdigest()
+    for digest, files in get_collisions(fulls).items():
+        duplicates[digest] += files
 
-    if md5_digest in db:
-        db[md5_digest] += [file]
-    else:
-        db[md5_digest] = [file]
+    return {digest: sorted(files) for digest, files in duplicates.items()}, stats
 
 
 if __name__ == '__main__':
-    with multiprocessing.Manager() as manager:
-        data = manager.dict({})
+    parser = argparse.ArgumentParser(description='Finds the files with identical contents in a directory')
 
-        procs = []
-        for current_dir, folders, files in os.walk(DIRECTORY):
-            for file in files:
-                full_path = os.path.join(current_dir, file)
-                proc = multiprocessing.Process(target=process, args=(full_path, data))
-                proc.start()
+    parser.add_argument('--directory', type=str, required=True)
+    parser.add_argument('--algorithm', choices=ALGORITHMS, default='md5')
+    parser.add_argument('--backend', choices=['process', 'thread'], default='process')
+    parser.add_argument('--workers', type=int, default=None)
 
-                procs.append(proc)
+    args = parser.parse_args()
 
-        for p in procs:
-            p.join()
+    start = time.time()
+    data, stats = find_duplicates(args.directory, algorithm=args.algorithm, backend=args.backend, workers=args.workers)
+    took = time.time() - start
 
-        print(json.dumps(dict(data), indent=4, sort_keys=True))
+    print(json.dumps(data, indent=4, sort_keys=True))
+    print_throughput(stats, took)
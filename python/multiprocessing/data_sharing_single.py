@@ -1,33 +1,67 @@
 """
-Test Python's Multiprocessing with data sharing
+Single process reference for the data sharing scripts
 
-Reads all the files in a directory and stores their md5 hash on list
+Reads all the files in a directory one after another, hashes them in fixed-size chunks and prints the files with
+identical contents using the same output as data_sharing.py. The throughput is printed to stderr so the scripts can be
+compared with each other.
+
+Parameters:
+    --directory Directory to search for duplicates
+    --algorithm Hash algorithm, one of md5, sha1 or blake2b
+
+Usage:
+    python data_sharing_single.py --directory /path --algorithm blake2b
 """
-import hashlib
+import argparse
 import json
-import multiprocessing
 import os
 import time
-from typing import Dict
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from file_hashing import ALGORITHMS, full_digest, print_throughput
+
+
+def find_duplicates(directory: str, algorithm: str = 'md5') -> Tuple[Dict[str, List], Dict]:
+    """
+    Finds the files with identical contents by fully hashing every file
+
+    :param directory: Directory to search for duplicates
+    :param algorithm: Name of the hashlib algorithm
+    :return: Digests mapped to the files having them and statistics on the bytes read
+    """
+    stats = {'files': 0, 'bytes_total': 0, 'bytes_read': 0}
+    data = defaultdict(list)
 
-DIRECTORY = ''
+    for current_dir, folders, files in os.walk(directory):
+        for file in files:
+            full_path = os.path.join(current_dir, file)
 
+            try:
+                _, digest, read = full_digest(full_path, algorithm)
+            except OSError:
+                continue
 
-def process(file: str, db: Dict) -> None:
-    md5_digest = hashlib.md5(open(file, 'rb').read()).hexdigest()
-    db[md5_digest] = file
+            data[digest].append(full_path)
+
+            stats['files'] += 1
+            stats['bytes_total'] += read
+            stats['bytes_read'] += read
+
+    return {digest: sorted(files) for digest, files in data.items() if len(files) > 1}, stats
 
 
 if __name__ == '__main__':
-    with multiprocessing.Manager() as manager:
-        data = manager.dict({})
-
-        procs = []
-        for current_dir, folders, files in os.walk(DIRECTORY):
-            for file in files:
-                full_path = os.path.join(current_dir, file)
-                md5_digest = hashlib.md5(open(full_path, 'rb').read()).hexdigest()
-                data[md5_digest] = full_path
-                time.sleep(0.500)
-
-        print(json.dumps(dict(data), indent=4, sort_keys=True))
+    parser = argparse.ArgumentParser(description='Finds the files with identical contents in a directory')
+
+    parser.add_argument('--directory', type=str, required=True)
+    parser.add_argument('--algorithm', choices=ALGORITHMS, default='md5')
+
+    args = parser.parse_args()
+
+    start = time.time()
+    data, stats = find_duplicates(args.directory, algorithm=args.algorithm)
+    took = time.time() - start
+
+    print(json.dumps(data, indent=4, sort_keys=True))
+    print_throughput(stats, took)
@@ -0,0 +1,113 @@
+"""
+File hashing backends shared by the data sharing scripts
+
+Hashing is I/O bound and hashlib releases the GIL while it digests large buffers so files are hashed on a thread pool.
+Large files are memory-mapped and fed to hashlib as memoryview slices so their contents are never copied into Python
+bytes objects.
+"""
+import functools
+import hashlib
+import mmap
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+ALGORITHMS = ['md5', 'sha1', 'blake2b']
+CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def full_digest(file: str, algorithm: str = 'md5') -> Tuple[str, str, int]:
+    """
+    Hashes a whole file reading it in CHUNK_SIZE chunks
+
+    :param file: Path of the file
+    :param algorithm: Name of the hashlib algorithm
+    :return: Path of the file, hex digest and number of bytes read
+    """
+    digest = hashlib.new(algorithm)
+    read = 0
+
+    with open(file, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, CHUNK_SIZE), b''):
+            digest.update(chunk)
+            read += len(chunk)
+
+    return file, digest.hexdigest(), read
+
+
+def mmap_digest(file: str, algorithm: str = 'md5') -> Tuple[str, str, int]:
+    """
+    Hashes a whole file, files of at least MMAP_THRESHOLD bytes are memory-mapped instead of read
+
+    :param file: Path of the file
+    :param algorithm: Name of the hashlib algorithm
+    :return: Path of the file, hex digest and number of bytes read
+    """
+    digest = hashlib.new(algorithm)
+
+    with open(file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        if size < MMAP_THRESHOLD:
+            data = f.read()
+            digest.update(data)
+
+            return file, digest.hexdigest(), len(data)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, size, CHUNK_SIZE):
+                    digest.update(view[offset:offset + CHUNK_SIZE])
+
+    return file, digest.hexdigest(), size
+
+
+def try_digest(digest_function: Callable, file: str, algorithm: str = 'md5') -> Optional[Tuple[str, str, int]]:
+    """
+    Hashes a file, skipping it if it cannot be read, e.g. when it was deleted after being listed
+
+    :param digest_function: Function hashing one file, see full_digest and mmap_digest
+    :param file: Path of the file
+    :param algorithm: Name of the hashlib algorithm
+    :return: Path of the file, hex digest and number of bytes read, None if the file cannot be read
+    """
+    try:
+        return digest_function(file, algorithm)
+    except OSError:
+        return None
+
+
+def hash_files(files: Iterable[str], digest_function: Callable = mmap_digest, algorithm: str = 'md5',
+               threads: int = None) -> Iterator[Tuple[str, str, int]]:
+    """
+    Hashes files on a thread pool
+
+    :param files: Paths of the files
+    :param digest_function: Function hashing one file, see full_digest and mmap_digest
+    :param algorithm: Name of the hashlib algorithm
+    :param threads: Number of threads, defaults to ThreadPoolExecutor's default
+    :return: Path, hex digest and number of bytes read of every readable file in input order
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for result in executor.map(functools.partial(try_digest, digest_function, algorithm=algorithm), files):
+            if result is not None:
+                yield result
+
+
+def print_throughput(stats: Dict, took: float) -> None:
+    """
+    Prints the files and bytes processed per second to stderr so it does not mix with the json output
+
+    :param stats: Number of files, total size of the files and bytes actually read
+    :param took: Duration in seconds
+    """
+    read_ratio = stats['bytes_read'] / stats['bytes_total'] if stats['bytes_total'] else 0
+    took = max(took, 1e-9)
+
+    print(
+        f"Files: {stats['files']}, read {stats['bytes_read']} of {stats['bytes_total']} bytes ({read_ratio:.2%}), "
+        f"took {took:.2f}s ({stats['files'] / took:.0f} files/s, {stats['bytes_total'] / took / 1024 / 1024:.1f}MB/s)",
+        file=sys.stderr
+    )
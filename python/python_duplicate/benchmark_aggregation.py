@@ -0,0 +1,77 @@
+"""
+Compares the 'local' and 'manager' aggregation strategies of image_duplicate.scan on a synthetic tree
+
+Generates random images (a fraction of them saved more than once so there are duplicates) into a temporary
+directory and times a scan with each strategy.
+
+Parameters:
+    --images Number of distinct images to generate
+    --duplicate-ratio Fraction of the images that are written a second time
+    --processes Number of worker processes (defaults to the CPU count)
+    --chunk-size Number of files sent to a worker per task
+
+Usage:
+    python -m python_duplicate.benchmark_aggregation --images 3000 --duplicate-ratio 0.1
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy
+from PIL import Image
+
+from python_duplicate.image_duplicate import scan
+
+
+def generate_tree(directory: str, images: int, duplicate_ratio: float, subdirectories: int = 10) -> int:
+    files = 0
+
+    for index in range(images):
+        pixels = numpy.random.randint(0, 256, (64, 64, 3), dtype=numpy.uint8)
+        image = Image.fromarray(pixels)
+
+        copies = 2 if random.random() < duplicate_ratio else 1
+
+        for copy in range(copies):
+            subdirectory = os.path.join(directory, str(random.randrange(subdirectories)))
+            os.makedirs(subdirectory, exist_ok=True)
+
+            image.save(os.path.join(subdirectory, f'{index}-{copy}.png'))
+            files += 1
+
+    return files
+
+
+def run(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        files = generate_tree(directory, args.images, args.duplicate_ratio)
+        print(f'Generated {files} files')
+
+        for aggregation in ['manager', 'local']:
+            start = time.time()
+            results = scan([directory], processes=args.processes, chunk_size=args.chunk_size, aggregation=aggregation)
+            took = time.time() - start
+
+            duplicates = sum(data['counter'] for data in results.values() if data['counter'] > 1)
+
+            print(f'[{aggregation}]')
+            print(f'\t Took: {took:.2f}s ({files / took:.0f} files/s)')
+            print(f'\t Hashed: {sum(data["counter"] for data in results.values())}')
+            print(f'\t Duplicates: {duplicates}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Compares the aggregation strategies of image_duplicate on a synthetic tree"
+    )
+
+    parser.add_argument('--images', type=int, default=3000)
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=64)
+
+    args = parser.parse_args()
+
+    run(args)
@@ -0,0 +1,94 @@
+"""
+Measures the query latency of HammingIndex against the exact-lookup layout it replaced
+
+Random hashes are indexed along with near copies of some of them, then queries are timed with the substrings chosen
+from the size of the index and with threshold + 1 substrings looked up exactly. The layouts must return the same
+matches.
+
+Parameters:
+    --size Number of indexed hashes
+    --bits Number of bits of the hashes, 64 for phash:8
+    --threshold Largest distance searched for
+    --queries Number of timed queries
+    --near-ratio Fraction of the indexed hashes that are near copies of another one
+
+Usage:
+    python -m python_duplicate.benchmark_hamming_index --size 1000000 --bits 64 --threshold 10
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import List, Tuple
+
+from python_duplicate.hamming_index import HammingIndex
+
+
+def generate_hashes(size: int, bits: int, threshold: int, near_ratio: float) -> List[int]:
+    hashes = []
+
+    for _ in range(size):
+        if hashes and random.random() < near_ratio:
+            flipped = random.sample(range(bits), random.randint(0, threshold))
+            hashes.append(random.choice(hashes) ^ sum(1 << bit for bit in flipped))
+        else:
+            hashes.append(random.getrandbits(bits))
+
+    return hashes
+
+
+def time_queries(index: HammingIndex, queries: List[int]) -> Tuple[List[float], List[List]]:
+    latencies = []
+    results = []
+
+    for query in queries:
+        start = time.perf_counter()
+        results.append(sorted(index.query(query)))
+        latencies.append(time.perf_counter() - start)
+
+    return latencies, results
+
+
+def run(args: argparse.Namespace) -> None:
+    hashes = generate_hashes(args.size, args.bits, args.threshold, args.near_ratio)
+    queries = random.sample(hashes, args.queries)
+    expected = None
+
+    for name, substrings in [('auto', None), ('exact lookup', args.threshold + 1)]:
+        start = time.time()
+        index = HammingIndex(args.bits, args.threshold, substrings=substrings)
+
+        for identifier, hashed in enumerate(hashes):
+            index.add(identifier, hashed)
+
+        took = time.time() - start
+
+        latencies, results = time_queries(index, queries)
+        latencies.sort()
+
+        print(f'[{name}] {len(index.widths)} substrings, radius {index.radius}')
+        print(f'\t Built in {took:.2f}s')
+        print(
+            f'\t Query p50: {statistics.median(latencies) * 1000:.2f}ms, '
+            f'p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms, '
+            f'mean: {statistics.mean(latencies) * 1000:.2f}ms'
+        )
+
+        if expected is not None and results != expected:
+            raise SystemExit(f'[{name}] returned different matches')
+
+        expected = results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the query latency of HammingIndex')
+
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--bits', type=int, default=64)
+    parser.add_argument('--threshold', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--near-ratio', type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    run(args)
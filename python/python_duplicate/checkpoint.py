@@ -0,0 +1,57 @@
+"""
+Checkpoints of long scans so they can be resumed after an interruption
+
+The checkpoint is an NDJSON file with a record per hashed file and a record per directory whose files are all hashed.
+It is flushed every few seconds, so an interruption loses at most the records of the last interval.
+"""
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from python_duplicate.ndjson_output import NdjsonWriter, read_records
+
+
+class Checkpoint(object):
+    """
+    This class records the progress of a scan and loads it back when resuming.
+    """
+
+    def __init__(self, path: str, resume: bool = False, interval: float = 30.0) -> None:
+        self.interval = interval
+        self.flushed = time.time()
+
+        self.files: Dict[str, Tuple[Optional[str], int]] = {}
+        self.directories: Set[str] = set()
+
+        if resume and os.path.exists(path):
+            for record in read_records(path):
+                if 'directory' in record:
+                    self.directories.add(record['directory'])
+                else:
+                    self.files[record['path']] = (record['hash'], record['size'])
+
+        self.writer = NdjsonWriter(path, batch_size=10000, truncate=not resume)
+
+        super().__init__()
+
+    def __enter__(self) -> 'Checkpoint':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def add_file(self, path: str, hashed: Optional[str], size: int) -> None:
+        self.write({"path": path, "hash": hashed, "size": size})
+
+    def finish_directory(self, directory: str) -> None:
+        self.write({"directory": directory})
+
+    def write(self, record: Dict) -> None:
+        self.writer.write(record)
+
+        if time.time() - self.flushed >= self.interval:
+            self.writer.flush()
+            self.flushed = time.time()
+
+    def close(self) -> None:
+        self.writer.close()
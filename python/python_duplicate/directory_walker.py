@@ -0,0 +1,111 @@
+"""
+Directory walker built on os.scandir
+
+Every directory is listed on a thread pool so several subtrees are enumerated at the same time, which hides the
+latency of network file systems. Files are filtered by extension while walking and are yielded with the stat result
+fetched by the walk so callers do not need to stat them again.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+
+class FileEntry(NamedTuple):
+    path: str
+    extension: str
+    stat: os.stat_result
+    directory: str
+
+
+def get_extension(name: str) -> str:
+    return os.path.splitext(name)[1][1:].lower()
+
+
+def scan_directory(directory: str, include: Optional[Set[str]] = None, exclude: Optional[Set[str]] = None,
+                   list_files: bool = True) -> Tuple[List[FileEntry], List[str]]:
+    """
+    Lists the files and subdirectories of a single directory
+
+    :param directory: Directory to list
+    :param include: Lowercase extensions (without the dot) to keep, everything is kept if None
+    :param exclude: Lowercase extensions (without the dot) to drop
+    :param list_files: Whether files are returned, only subdirectories are listed otherwise
+    :return: Files of the directory and its subdirectories
+    """
+    files = []
+    directories = []
+
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        # Like os.walk, symlinks to directories are not followed
+                        if not entry.is_symlink():
+                            directories.append(entry.path)
+                        continue
+
+                    if not list_files:
+                        continue
+
+                    extension = get_extension(entry.name)
+
+                    if include is not None and extension not in include:
+                        continue
+
+                    if exclude is not None and extension in exclude:
+                        continue
+
+                    files.append(FileEntry(entry.path, extension, entry.stat(), directory))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+
+    return files, directories
+
+
+def walk(directories: Iterable[str], include: Iterable[str] = None, exclude: Iterable[str] = None,
+         threads: int = 8, skip_files: Set[str] = None, on_listed: Callable[[str], None] = None) -> Iterator[FileEntry]:
+    """
+    Walks the directories recursively, listing up to `threads` directories at the same time
+
+    Files are yielded as soon as their directory is listed so the order is not deterministic.
+
+    :param directories: Root directories to walk
+    :param include: Extensions (without the dot) to keep, everything is kept if None
+    :param exclude: Extensions (without the dot) to drop
+    :param threads: Number of directories listed concurrently
+    :param skip_files: Directories whose files are not listed, their subdirectories are still walked
+    :param on_listed: Called with a directory once all its files have been consumed
+    :return: Files found with their stat result
+    """
+    include = None if include is None else {extension.lower() for extension in include}
+    exclude = None if exclude is None else {extension.lower() for extension in exclude}
+    skip_files = skip_files or set()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        def submit(directory: str) -> Future:
+            future = executor.submit(scan_directory, directory, include, exclude, directory not in skip_files)
+            futures[future] = directory
+
+            return future
+
+        futures: Dict[Future, str] = {}
+        pending = {submit(directory) for directory in directories}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                files, subdirectories = future.result()
+
+                for subdirectory in subdirectories:
+                    pending.add(submit(subdirectory))
+
+                yield from files
+
+                directory = futures.pop(future)
+
+                if on_listed is not None and directory not in skip_files:
+                    on_listed(directory)
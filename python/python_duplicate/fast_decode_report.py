@@ -0,0 +1,67 @@
+"""
+Reports how often the fast-decode path of image_duplicate produces a different hash than a full decode
+
+Hashes every image twice, once decoded at full resolution and once with draft()/reduce(), and prints how many hashes
+are identical, the distribution of the Hamming distance between the two and the time spent in each path.
+
+Parameters:
+    --directories List of directories to search for images
+    --hash-size Hash size passed to dhash
+
+Usage:
+    python -m python_duplicate.fast_decode_report --directories /path/a /path/b
+"""
+import argparse
+import logging
+import time
+from collections import Counter
+
+from python_duplicate.hamming_index import hamming_distance
+from python_duplicate.image_duplicate import dhash, get_image_files
+
+
+def run(args: argparse.Namespace) -> None:
+    distances = Counter()
+    timings = {'full': 0.0, 'fast': 0.0}
+
+    for file in get_image_files(args.directories):
+        try:
+            start = time.time()
+            full = dhash(file, hash_size=args.hash_size)
+            timings['full'] += time.time() - start
+
+            start = time.time()
+            fast = dhash(file, hash_size=args.hash_size, fast_decode=True)
+            timings['fast'] += time.time() - start
+        except Exception:
+            logging.exception(f"Problem: {file}")
+            continue
+
+        distances[hamming_distance(int(full, 16), int(fast, 16))] += 1
+
+    total = sum(distances.values())
+
+    if not total:
+        print('No images found')
+        return
+
+    print(f'Images: {total}')
+    print(f'Identical: {distances[0]} ({distances[0] / total:.2%})')
+    print(f'Full decode: {timings["full"]:.2f}s, fast decode: {timings["fast"]:.2f}s')
+    print('Distance distribution:')
+
+    for distance, count in sorted(distances.items()):
+        print(f'\t {distance}: {count} ({count / total:.2%})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Reports how often the fast-decode hashes differ from the full-decode hashes'
+    )
+
+    parser.add_argument('--directories', nargs='+', required=True)
+    parser.add_argument('--hash-size', type=int, default=72)
+
+    args = parser.parse_args()
+
+    run(args)
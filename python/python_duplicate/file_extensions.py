@@ -1,60 +1,189 @@
 """
-Gets all the file extensions in a list of directories
+Gets all the file extensions in a list of directories with the number of files, their total size and the largest file
 
-Implements Python Multiprocessing to speed up job
+Each top-level subdirectory is a shard aggregated into its own counters, optionally on a process pool, and the
+counters are merged at the end.
 
-Usage:
-    Input directory paths inside the directories variable (L:39)
+Parameters:
+    --directories List of directories to search
+    --processes Number of worker processes, shards are walked in the main process if not set
+    --walk-threads Number of directories listed concurrently per shard
+    --output-ndjson Appends a path/extension/size record per file to this file while walking
+    --profile JSON file where per-stage timings, throughput counters and sampled RSS are written, files are walked
+              and aggregated in batches of BATCH_SIZE which are timed as a whole
+    --profile-workers Directory where every worker dumps its cProfile stats (expensive, requires --profile)
 
-    python file_extensions.py
+Usage:
+    python -m python_duplicate.file_extensions --directories /path/a /path/b --processes 8
 """
+import argparse
+import contextlib
+import functools
+import itertools
 import json
 import multiprocessing
 import os
 import time
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Tuple
 
 import memory_profiler
-from python_duplicate.image_duplicate import get_directory_items
+from python_duplicate.directory_walker import FileEntry, scan_directory, walk
+from python_duplicate.ndjson_output import NdjsonWriter
+from python_duplicate.profiler import Profiler, count, merge_result, profiled, stage
+
+BATCH_SIZE = 1000
+
+
+class ExtensionStats(NamedTuple):
+    counts: Counter
+    sizes: Counter
+    largest: Dict[str, Tuple[int, str]]
+
+
+def new_stats() -> ExtensionStats:
+    return ExtensionStats(Counter(), Counter(), {})
+
+
+def add_entries(stats: ExtensionStats, entries: Iterable[FileEntry], writer: NdjsonWriter = None) -> ExtensionStats:
+    iterator = iter(entries)
+
+    while True:
+        with stage('walk'):
+            batch = list(itertools.islice(iterator, BATCH_SIZE))
+
+        if not batch:
+            return stats
+
+        with stage('aggregate'):
+            for entry in batch:
+                _, e = os.path.splitext(entry.path)
+                size = entry.stat.st_size
+
+                if writer is not None:
+                    writer.write({"path": entry.path, "extension": e, "size": size})
+
+                stats.counts[e] += 1
+                stats.sizes[e] += size
+
+                if e not in stats.largest or size > stats.largest[e][0]:
+                    stats.largest[e] = (size, entry.path)
+
+        count('files', len(batch))
+        count('bytes', sum(entry.stat.st_size for entry in batch))
+
 
+def merge_stats(stats: ExtensionStats, other: ExtensionStats) -> ExtensionStats:
+    stats.counts.update(other.counts)
+    stats.sizes.update(other.sizes)
 
-def find_extensions(file, data, lock: multiprocessing.Lock):
-    f, e = os.path.splitext(file)
+    for e, largest in other.largest.items():
+        if e not in stats.largest or largest[0] > stats.largest[e][0]:
+            stats.largest[e] = largest
 
-    lock.acquire()
+    return stats
 
-    try:
-        if e in data:
-            data[e] += 1
+
+def find_extensions(directories: List[str], walk_threads: int = 8, output: str = None) -> ExtensionStats:
+    if output is None:
+        return add_entries(new_stats(), walk(directories, threads=walk_threads))
+
+    with NdjsonWriter(output) as writer:
+        return add_entries(new_stats(), walk(directories, threads=walk_threads), writer)
+
+
+def get_extensions(directories: Iterable[str], processes: int = None, walk_threads: int = 8,
+                   output: str = None) -> ExtensionStats:
+    """
+    Aggregates the extensions of every file in the directories
+
+    :param directories: Directories to search
+    :param processes: Number of worker processes, shards are walked in the main process if not set
+    :param walk_threads: Number of directories listed concurrently per shard
+    :param output: NDJSON file where a path/extension/size record is appended per file
+    :return: Number of files, total size and largest file per extension
+    """
+    stats = new_stats()
+    shards = []
+
+    for directory in directories:
+        files, subdirectories = scan_directory(directory)
+
+        if output is None:
+            add_entries(stats, files)
         else:
-            data[e] = 1
-    finally:
-        lock.release()
+            with NdjsonWriter(output) as writer:
+                add_entries(stats, files, writer)
 
+        shards += [[subdirectory] for subdirectory in subdirectories]
 
-if __name__ == "__main__":
-    start = time.time()
-    print('Memory (Before): ' + str(memory_profiler.memory_usage()) + 'MB')
+    task = functools.partial(find_extensions, walk_threads=walk_threads, output=output)
+
+    if not processes:
+        for shard in shards:
+            merge_stats(stats, task(shard))
+
+        return stats
+
+    with multiprocessing.Pool(processes) as pool:
+        for shard_stats in pool.imap_unordered(profiled(task), shards):
+            merge_stats(stats, merge_result(shard_stats))
 
-    directories = []
+    return stats
 
-    with multiprocessing.Manager() as manager:
-        lock = multiprocessing.Lock()
-        data = manager.dict({})
 
-        procs = []
-        for directory in directories:
-            for item_a in get_directory_items(directory):
-                _, ext = os.path.splitext(item_a)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Gets all the file extensions in a list of directories')
+
+    parser.add_argument('--directories', nargs='+', required=True)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--walk-threads', type=int, default=8)
+    parser.add_argument('--output-ndjson', type=str, default=None)
+    parser.add_argument('--profile', type=str, default=None)
+    parser.add_argument('--profile-workers', type=str, default=None)
 
-                proc = multiprocessing.Process(target=find_extensions, args=(item_a, data, lock))
-                proc.start()
+    args = parser.parse_args()
 
-                procs.append(proc)
+    if args.profile_workers is not None and args.profile is None:
+        parser.error('--profile-workers requires --profile')
 
-        for p in procs:
-            p.join()
+    start = time.time()
+    print('Memory (Before): ' + str(memory_profiler.memory_usage()) + 'MB')
 
-        json.dump(dict(data), open('extensions.json', 'w'), indent=4)
+    if args.output_ndjson is not None:
+        NdjsonWriter(args.output_ndjson, truncate=True).close()
+
+    with contextlib.ExitStack() as stack:
+        if args.profile is not None:
+            if args.profile_workers is not None:
+                os.makedirs(args.profile_workers, exist_ok=True)
+
+            profiler = stack.enter_context(Profiler(worker_directory=args.profile_workers, rss_interval=1.0))
+
+        stats = get_extensions(
+            args.directories,
+            processes=args.processes,
+            walk_threads=args.walk_threads,
+            output=args.output_ndjson
+        )
+
+        data = {
+            e: {
+                "count": files,
+                "bytes": stats.sizes[e],
+                "largest": {
+                    "path": stats.largest[e][1],
+                    "size": stats.largest[e][0]
+                }
+            }
+            for e, files in stats.counts.most_common()
+        }
+
+        with stage('write'):
+            json.dump(data, open('extensions.json', 'w'), indent=4)
+
+    if args.profile is not None:
+        profiler.save(args.profile)
 
     end_time = time.time() - start
 
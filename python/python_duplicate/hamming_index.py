@@ -0,0 +1,215 @@
+"""
+Multi-index hashing over integer hashes for Hamming distance searches
+
+Each hash is split into m substrings which are indexed in their own table. By the pigeonhole principle two hashes
+within the threshold have at least one substring within threshold // m of each other, so a query only looks up the
+buckets around its own substrings and verifies the hashes found there instead of comparing against every indexed hash.
+
+Substrings are about log2(n) bits wide for n indexed hashes so each bucket holds about one hash, more (narrower)
+substrings would fill the buckets with unrelated hashes. The tables are rebuilt with fewer substrings as the index
+grows, and never use more than threshold + 1 of them since exact lookups are enough at that point.
+
+See benchmark_hamming_index.py for query latencies.
+"""
+import itertools
+import math
+import pickle
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def get_substring_count(bits: int, threshold: int, size: int) -> int:
+    """
+    Gets the number of substrings for which each bucket holds about one hash
+
+    :param bits: Number of bits of the hashes
+    :param threshold: Largest distance searched for
+    :param size: Number of indexed hashes
+    :return: Number of substrings, between 1 and threshold + 1
+    """
+    return max(1, min(threshold + 1, round(bits / math.log2(max(size, 2)))))
+
+
+def get_masks(width: int, radius: int) -> List[int]:
+    """
+    Gets the masks flipping up to radius bits of a substring
+
+    :param width: Number of bits of the substring
+    :param radius: Largest number of flipped bits
+    :return: Masks, starting with 0 for the substring itself
+    """
+    return [
+        sum(1 << bit for bit in bits) for distance in range(min(radius, width) + 1)
+        for bits in itertools.combinations(range(width), distance)
+    ]
+
+
+class HammingIndex(object):
+    """
+    This class indexes integer hashes and finds the ones within a Hamming distance of a query.
+    """
+
+    def __init__(self, bits: int, threshold: int, substrings: int = None) -> None:
+        self.bits = bits
+        self.threshold = threshold
+        # Chosen from the number of indexed hashes if not given
+        self.fixed_substrings = substrings
+
+        self.keys: List[Hashable] = []
+        self.hashes: List[int] = []
+        self.ids: Dict[Hashable, int] = {}
+
+        # Set by build()
+        self.size = 0
+        self.widths: List[int] = []
+        self.radius = 0
+        self.masks: List[List[int]] = []
+        self.tables: List[Dict[int, List[int]]] = []
+
+        self.build(1)
+
+        super().__init__()
+
+    def build(self, size: int) -> bool:
+        """
+        Splits the hashes in the number of substrings suited to an index of the given size and rebuilds the tables
+
+        :param size: Number of hashes the index is about to hold
+        :return: Whether the tables were rebuilt, they are kept if the number of substrings is the same
+        """
+        self.size = size
+        substrings = self.fixed_substrings or get_substring_count(self.bits, self.threshold, size)
+
+        if len(self.widths) == substrings and self.tables:
+            return False
+
+        self.widths = [
+            self.bits // substrings + (1 if index < self.bits % substrings else 0) for index in range(substrings)
+        ]
+        self.radius = self.threshold // substrings
+
+        masks = {width: get_masks(width, self.radius) for width in set(self.widths)}
+        self.masks = [masks[width] for width in self.widths]
+        self.tables = [{} for _ in self.widths]
+
+        for identifier, hashed in enumerate(self.hashes):
+            self.add_substrings(identifier, hashed)
+
+        return True
+
+    def add_substrings(self, identifier: int, hashed: int) -> None:
+        for table, substring in zip(self.tables, self.substrings(hashed)):
+            table.setdefault(substring, []).append(identifier)
+
+    def __getstate__(self) -> Dict:
+        # The tables are rebuilt when loaded, which is about as fast as unpickling them
+        state = self.__dict__.copy()
+        state.update(widths=[], masks=[], tables=[])
+
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        state.setdefault('fixed_substrings', None)
+        self.__dict__.update(state)
+        self.widths, self.tables = [], []
+        self.build(max(len(self.keys), 1))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.ids
+
+    def substrings(self, hashed: int) -> Iterable[int]:
+        for width in self.widths:
+            yield hashed & ((1 << width) - 1)
+            hashed >>= width
+
+    def add(self, key: Hashable, hashed: int) -> None:
+        """
+        Indexes a hash, keys that are already indexed are ignored
+
+        :param key: Value returned by queries matching this hash
+        :param hashed: Integer hash
+        """
+        if key in self.ids:
+            return
+
+        identifier = len(self.keys)
+
+        self.ids[key] = identifier
+        self.keys.append(key)
+        self.hashes.append(hashed)
+
+        # The substrings are chosen again each time the index doubles
+        if len(self.keys) < self.size * 2 or not self.build(len(self.keys)):
+            self.add_substrings(identifier, hashed)
+
+    def query(self, hashed: int) -> List[Tuple[Hashable, int]]:
+        """
+        Finds the indexed hashes within the threshold
+
+        :param hashed: Integer hash to search for
+        :return: Key and distance of every match
+        """
+        candidates = set()
+
+        for table, masks, substring in zip(self.tables, self.masks, self.substrings(hashed)):
+            for mask in masks:
+                identifiers = table.get(substring ^ mask)
+
+                if identifiers:
+                    candidates.update(identifiers)
+
+        matches = []
+
+        for identifier in candidates:
+            distance = hamming_distance(hashed, self.hashes[identifier])
+
+            if distance <= self.threshold:
+                matches.append((self.keys[identifier], distance))
+
+        return matches
+
+    def clusters(self, keys: Iterable[Hashable],
+                 confirm: Callable[[Hashable, Hashable], bool] = None) -> List[List[Hashable]]:
+        """
+        Groups the keys with their near duplicates, only keys in the given set end up in the clusters
+
+        :param keys: Indexed keys to cluster
+        :param confirm: Called with two matching keys, they are only grouped if it returns True
+        :return: Groups of at least two similar keys
+        """
+        keys = list(dict.fromkeys(keys))
+        parents = {key: key for key in keys}
+
+        def find(key: Hashable) -> Hashable:
+            while parents[key] != key:
+                parents[key] = parents[parents[key]]
+                key = parents[key]
+
+            return key
+
+        for key in keys:
+            for match, _ in self.query(self.hashes[self.ids[key]]):
+                if match in parents and (confirm is None or confirm(key, match)):
+                    parents[find(match)] = find(key)
+
+        groups: Dict[Hashable, List[Hashable]] = {}
+
+        for key in keys:
+            groups.setdefault(find(key), []).append(key)
+
+        return [group for group in groups.values() if len(group) > 1]
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: str) -> 'HammingIndex':
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,112 @@
+"""
+Persistent SQLite cache of image hashes
+
+Hashes are keyed by the path, size and mtime of the file along with the hash algorithms (and the decoding scale) they
+were computed with so unchanged files can be skipped on later scans. Files that are not valid images are stored with a NULL hash so they
+are skipped as well until they change.
+"""
+import os
+import sqlite3
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from python_duplicate.profiler import stage
+
+
+class HashCache(object):
+    """
+    This class stores and looks up the hash of files between scans.
+    """
+
+    def __init__(self, path: str, algorithm: str, batch_size: int = 10000) -> None:
+        self.connection = sqlite3.connect(path)
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.scan_id = time.time_ns()
+
+        self.seen: List[Tuple] = []
+        self.writes: List[Tuple] = []
+
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS image_hashes ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, algorithm TEXT, hash TEXT, scan_id INTEGER'
+            ')'
+        )
+
+        super().__init__()
+
+    def __enter__(self) -> 'HashCache':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def get(self, path: str, stat: os.stat_result) -> Tuple[bool, Optional[str]]:
+        """
+        Looks up the hash of a file and marks it as seen in the current scan
+
+        :param path: Path of the file
+        :param stat: Result of os.stat on the file
+        :return: Whether the file is cached and its hash (None if the file could not be hashed)
+        """
+        row = self.connection.execute(
+            'SELECT size, mtime_ns, algorithm, hash FROM image_hashes WHERE path = ?', (path,)
+        ).fetchone()
+
+        if row is None or row[:3] != (stat.st_size, stat.st_mtime_ns, self.algorithm):
+            return False, None
+
+        self.touch(path)
+
+        return True, row[3]
+
+    def touch(self, path: str) -> None:
+        """
+        Marks a file as seen in the current scan so it is not evicted
+
+        :param path: Path of the file
+        """
+        self.seen.append((self.scan_id, path))
+
+        if len(self.seen) >= self.batch_size:
+            self.flush()
+
+    def put(self, path: str, stat: os.stat_result, hashed: Optional[str]) -> None:
+        self.writes.append((path, stat.st_size, stat.st_mtime_ns, self.algorithm, hashed, self.scan_id))
+
+        if len(self.writes) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        with stage('write'), self.connection:
+            self.connection.executemany('UPDATE image_hashes SET scan_id = ? WHERE path = ?', self.seen)
+            self.connection.executemany('INSERT OR REPLACE INTO image_hashes VALUES (?, ?, ?, ?, ?, ?)', self.writes)
+
+        self.seen = []
+        self.writes = []
+
+    def evict(self, directories: Iterable[str]) -> int:
+        """
+        Deletes the entries under the directories that were not seen in the current scan
+
+        :param directories: Directories that were fully scanned
+        :return: Number of deleted entries
+        """
+        self.flush()
+
+        deleted = 0
+
+        with self.connection:
+            for directory in directories:
+                prefix = os.path.join(directory, '')
+
+                deleted += self.connection.execute(
+                    'DELETE FROM image_hashes WHERE scan_id != ? AND substr(path, 1, ?) = ?',
+                    (self.scan_id, len(prefix), prefix)
+                ).rowcount
+
+        return deleted
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
@@ -5,20 +5,60 @@ directories.
 Uses dash to compare images
 Implements Python Multiprocessing to speed up job
 
-Usage:
-    Input directory paths inside the directories variable (L:107)
+Parameters:
+    --directories List of directories to search for images
+    --processes Number of worker processes (defaults to the CPU count)
+    --chunk-size Number of files sent to a worker per task
+    --aggregation 'local' merges per-worker hash maps (default), 'manager' shares a Manager dictionary
+    --cache SQLite file where hashes are kept between runs so unchanged files are skipped
+    --threshold Also groups images whose hashes differ by at most this many bits
+    --index File where the near-duplicate index is kept between runs (its threshold is fixed when first created)
+    --fast-decode Decodes JPEGs at a reduced scale before resizing (see fast_decode_report.py for the hash drift)
+    --walk-threads Number of directories listed concurrently
+    --output-ndjson Appends a path/hash/size record per file to this file as results arrive instead of writing
+                    results.json, group the records with python_duplicate.ndjson_output
+    --checkpoint File where the progress of the scan is periodically saved
+    --checkpoint-interval Largest number of seconds between two saves of the checkpoint
+    --resume Skips the files and directories already in the checkpoint
+    --hashes Hashes computed for each image as 'name:size' (dhash, ahash, phash), defaults to dhash:72. With several
+             hashes, near-duplicate candidates are searched with the first one
+    --confirm-threshold Largest distance allowed between the other hashes of near-duplicate candidates
+    --store Directory where the hashes are kept in a compact array store instead of dictionaries, it is saved there
+            after the scan and can be reopened with python_duplicate.result_store.ResultStore.load
+    --profile JSON file where per-stage timings, throughput counters and sampled RSS are written
+    --profile-workers Directory where every worker dumps its cProfile stats (expensive, requires --profile)
 
-    python image_duplicate.py
+Usage:
+    python -m python_duplicate.image_duplicate --directories /path/a /path/b --processes 8
 """
+import argparse
+import contextlib
+import itertools
 import json
 import logging
 import os
 import time
-from multiprocessing import Manager, Lock, Process
-from typing import Dict
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import Manager, Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import memory_profiler
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+
+from python_duplicate.checkpoint import Checkpoint
+from python_duplicate.directory_walker import FileEntry, walk
+from python_duplicate.hamming_index import HammingIndex, hamming_distance
+from python_duplicate.hash_cache import HashCache
+from python_duplicate.ndjson_output import NdjsonWriter
+from python_duplicate.perceptual_hashes import get_hash_bits, get_resize_size, hash_images, split_key
+from python_duplicate.profiler import Profiler, count, merge_result, profiled, stage, timed
+from python_duplicate.result_store import ResultStore
+
+IMAGE_EXTENSIONS = ['jpg', 'png', 'gif', 'bmp', 'tif', 'tiff']
+DEFAULT_HASHES = ('dhash:72',)
+# Raised for files that are not images or are corrupt, unlike I/O or memory errors they happen again on every run
+INVALID_IMAGE_ERRORS = (UnidentifiedImageError, SyntaxError)
 
 logging.basicConfig(
     filemode='w',
@@ -29,106 +69,503 @@ logging.basicConfig(
 
 
 # https://blog.iconfinder.com/detecting-duplicate-images-using-python-cb240b05a3b6
-def dhash(image, hash_size=72):
-    # Grayscale and shrink the image in one step.
-    image = Image.open(image)
+def dhash(image, hash_size=72, fast_decode=False):
+    return dhash_batch([open_image(image, (hash_size + 1, hash_size), fast_decode)], hash_size=hash_size)[0]
 
-    image = image.convert('L').resize(
-        (hash_size + 1, hash_size),
-        Image.ANTIALIAS,
-    )
 
-    # Compare adjacent pixels.
-    difference = []
-    for row in range(hash_size):
-        for col in range(hash_size):
-            pixel_left = image.getpixel((col, row))
-            pixel_right = image.getpixel((col + 1, row))
-            difference.append(pixel_left > pixel_right)
+def open_image(file, size: Tuple[int, int] = (73, 72), fast_decode: bool = False) -> Image.Image:
+    """
+    Opens an image, optionally decoding it at a reduced scale that is still larger than the hash
+
+    JPEGs are decoded in grayscale at 1/2, 1/4 or 1/8 scale with draft(), other formats are shrunk by an integer
+    factor with reduce() before the final resize.
+
+    :param file: Path or file object of the image
+    :param size: Smallest size the image will be resized to
+    :param fast_decode: Whether to decode at a reduced scale
+    :return: Opened image
+    """
+    with stage('open'):
+        image = Image.open(file)
+
+    if not fast_decode:
+        return image
+
+    if image.format == 'JPEG':
+        image.draft('L', size)
+        return image
 
-    # Convert the binary array to a hexadecimal string.
-    decimal_value = 0
-    hex_string = []
+    factor = min(image.width // size[0], image.height // size[1])
 
-    for index, value in enumerate(difference):
-        if value:
-            decimal_value += 2 ** (index % 8)
-        if (index % 8) == 7:
-            hex_string.append(hex(decimal_value)[2:].rjust(2, '0'))
-            decimal_value = 0
-    return ''.join(hex_string)
+    if factor >= 2 and image.mode in ('L', 'RGB', 'RGBA'):
+        with stage('decode'):
+            return image.reduce(factor)
+
+    return image
+
+
+def dhash_batch(images: Iterable[Image.Image], hash_size=72) -> List[str]:
+    """
+    Computes the dHash of several already-decoded images in one call
+
+    The bits are packed least significant first so the hex strings are identical to the ones produced by the
+    original per-pixel implementation.
+
+    :param images: Decoded PIL images
+    :param hash_size: Number of rows/columns compared
+    :return: Hex string hash for each image, in input order
+    """
+    return hash_images(images, [f'dhash:{hash_size}'])
 
 
 def get_directory_items(directory: str):
-    for curr_dir, dirs, items in os.walk(directory):
-        for item in items:
-            yield os.path.join(curr_dir, item)
+    for entry in walk([directory]):
+        yield entry.path
+
+
+def get_image_entries(directories: Iterable[str], threads: int = 8, **kwargs) -> Iterator[FileEntry]:
+    return walk(directories, include=IMAGE_EXTENSIONS, threads=threads, **kwargs)
+
+
+def get_image_files(directories: Iterable[str], threads: int = 8) -> Iterator[str]:
+    for entry in get_image_entries(directories, threads):
+        yield entry.path
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def add_result(processed: Dict, hashed: str, file: str) -> None:
+    if hashed in processed:
+        logging.debug(f"Duplicate: {hashed}")
+
+        data = processed.get(hashed)
+        data['counter'] += 1
+        data['items'] += [file]
+
+        processed[hashed] = data
+    else:
+        processed[hashed] = {
+            "counter": 1,
+            "items": [file]
+        }
 
 
-def get_image(file: str) -> bool:
+def merge_results(processed: Dict, other: Dict) -> Dict:
+    for hashed, data in other.items():
+        if hashed in processed:
+            processed[hashed]['counter'] += data['counter']
+            processed[hashed]['items'] += data['items']
+        else:
+            processed[hashed] = data
+
+    return processed
+
+
+def process(file: str, processed: Dict, algorithms: Sequence[str] = DEFAULT_HASHES, fast_decode: bool = False,
+            invalid: List[str] = None):
     try:
-        return Image.open(file)
-    except Exception:
+        image = open_image(file, get_resize_size(algorithms), fast_decode)
+    except Exception as e:
         logging.exception(f"Not an image: {file}")
-        return None
+        count('failed')
 
+        if invalid is not None and isinstance(e, INVALID_IMAGE_ERRORS):
+            invalid.append(file)
 
-def process(file: str, processed: Dict):
-    image_a = get_image(file)
-
-    if image_a is None:
         return False
 
     try:
-        hashed = dhash(file)
-
-        if hashed in processed:
-            logging.debug(f"Duplicate: {hashed}")
+        with stage('decode'):
+            image.load()
 
-            data = processed.get(hashed)
-            data['counter'] += 1
-            data['items'] += [file]
+        hashed = hash_images([image], algorithms)[0]
 
-            processed[hashed] = data
-        else:
-            processed[hashed] = {
-                "counter": 1,
-                "items": [file]
-            }
+        add_result(processed, hashed, file)
 
     except Exception as e:
         logging.exception(f"Problem: {file}")
+        count('failed')
+
+        if invalid is not None and isinstance(e, INVALID_IMAGE_ERRORS):
+            invalid.append(file)
+
+
+def hash_chunk(files: List[str], algorithms: Sequence[str] = DEFAULT_HASHES,
+               fast_decode: bool = False) -> Tuple[Dict, List[str]]:
+    """
+    Hashes a chunk of files
+
+    :param files: Files to hash
+    :param algorithms: Hashes computed for each image as 'name:size', see perceptual_hashes
+    :param fast_decode: Whether images are decoded at a reduced scale, see open_image
+    :return: Hashes mapped to the counter and the files having that hash, and the files that are not valid images
+    """
+    processed = {}
+    invalid = []
+
+    for file in files:
+        process(file, processed, algorithms=algorithms, fast_decode=fast_decode, invalid=invalid)
+
+    return processed, invalid
+
+
+def process_chunk(files: List[str], processed: Dict, lock: Lock, algorithms: Sequence[str] = DEFAULT_HASHES,
+                  fast_decode: bool = False) -> Tuple[Dict, List[str]]:
+    hashes, invalid = hash_chunk(files, algorithms=algorithms, fast_decode=fast_decode)
+
+    for hashed, data in hashes.items():
+        for file in data['items']:
+            with lock:
+                add_result(processed, hashed, file)
+
+    return hashes, invalid
+
+
+def run_chunks(task: Callable, chunks: Iterable[List[str]], processes: int = None,
+               args: tuple = ()) -> Iterator[Tuple[List[str], Any]]:
+    """
+    Runs a task for every chunk on a fixed size process pool and yields the task results as they complete
+
+    Chunks are pulled lazily and at most two chunks per worker are in flight at any time so the number of processes
+    and the memory used stay flat regardless of the size of the tree.
+
+    :param task: Function called with a chunk of files followed by args
+    :param chunks: Lists of files to process
+    :param processes: Number of worker processes, defaults to the CPU count
+    :param args: Extra arguments passed to the task after the chunk
+    :return: Each chunk with the result of its task
+    """
+    processes = processes or os.cpu_count()
+    max_in_flight = processes * 2
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = {}
+
+        for chunk in chunks:
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+            pending[executor.submit(task, chunk, *args)] = chunk
+
+        for future in wait(pending).done:
+            yield pending[future], future.result()
+
+
+def scan(directories: Iterable[str], processes: int = None, chunk_size: int = 64, aggregation: str = 'local',
+         algorithms: Sequence[str] = DEFAULT_HASHES, fast_decode: bool = False, cache: HashCache = None,
+         walk_threads: int = 8, writer: NdjsonWriter = None, checkpoint: Checkpoint = None,
+         store: ResultStore = None) -> Dict:
+    """
+    Hashes every image in the directories
+
+    With 'local' aggregation every task builds its own hash map which the parent merges as tasks complete. With
+    'manager' aggregation the workers write into a Manager dictionary guarded by a lock, unless a writer or a store
+    is given since results then go to them as they arrive.
+
+    :param directories: Directories to search for images
+    :param processes: Number of worker processes, defaults to the CPU count
+    :param chunk_size: Number of files sent to a worker per task
+    :param aggregation: Either 'local' or 'manager'
+    :param algorithms: Hashes computed for each image as 'name:size', see perceptual_hashes
+    :param fast_decode: Whether images are decoded at a reduced scale, see open_image
+    :param cache: Hash cache used to skip unchanged files, entries of deleted files are evicted after the scan
+    :param walk_threads: Number of directories listed concurrently
+    :param writer: If given, a path/hash/size record is written per file as results arrive instead of being kept
+    :param checkpoint: Progress of the scan, files and finished directories it already holds are skipped
+    :param store: If given, results are added to this store and it is returned instead of a dictionary
+    :return: Hashes mapped to the counter and the files having that hash, empty if a writer is given
+    """
+    processed = {}
+
+    # Files sent to the workers, and per directory how many of them are not back yet
+    pending: Dict[str, FileEntry] = {}
+    outstanding = Counter()
+    listed = set()
+
+    def record(file: str, hashed: Optional[str], size: int) -> None:
+        if hashed is None:
+            return
+
+        if writer is not None:
+            writer.write({"path": file, "hash": hashed, "size": size})
+        elif store is not None:
+            with stage('aggregate'):
+                store.add(hashed, file)
+        else:
+            with stage('aggregate'):
+                add_result(processed, hashed, file)
+
+    def finish(directory: str) -> None:
+        listed.discard(directory)
+        del outstanding[directory]
+
+        if checkpoint is not None:
+            checkpoint.finish_directory(directory)
+
+    def on_listed(directory: str) -> None:
+        if outstanding[directory]:
+            listed.add(directory)
+        else:
+            finish(directory)
+
+    def is_known(entry: FileEntry) -> bool:
+        if checkpoint is not None and entry.path in checkpoint.files:
+            return True
+
+        if cache is None:
+            return False
+
+        cached, hashed = cache.get(entry.path, entry.stat)
+
+        if cached:
+            count('cached')
+            record(entry.path, hashed, entry.stat.st_size)
+
+            if checkpoint is not None:
+                checkpoint.add_file(entry.path, hashed, entry.stat.st_size)
+
+        return cached
+
+    def get_files() -> Iterator[str]:
+        entries = get_image_entries(directories, walk_threads, skip_files=skip_files, on_listed=on_listed)
+
+        for entry in timed('walk', entries):
+            if is_known(entry):
+                continue
+
+            pending[entry.path] = entry
+            outstanding[entry.directory] += 1
+
+            yield entry.path
+
+    skip_files = set()
+
+    if checkpoint is not None:
+        skip_files = checkpoint.directories
+
+        for file, (hashed, size) in checkpoint.files.items():
+            record(file, hashed, size)
+
+            if cache is not None:
+                cache.touch(file)
+
+    chunks = chunked(get_files(), chunk_size)
+
+    # With a writer or a store the results are recorded as they arrive, so the shared dictionary would only grow
+    share = aggregation == 'manager' and writer is None and store is None
+
+    with contextlib.ExitStack() as stack:
+        if share:
+            manager = stack.enter_context(Manager())
+            shared = manager.dict({})
+            lock = manager.Lock()
+
+            results = run_chunks(
+                profiled(process_chunk), chunks, processes, args=(shared, lock, algorithms, fast_decode)
+            )
+        else:
+            results = run_chunks(profiled(hash_chunk), chunks, processes, args=(algorithms, fast_decode))
+
+        for chunk, result in results:
+            result, invalid = merge_result(result)
+            invalid = set(invalid)
+
+            count('chunks')
+            count('files', len(chunk))
+
+            hashes = {file: hashed for hashed, data in result.items() for file in data['items']}
+
+            for file in chunk:
+                entry = pending.pop(file)
+                hashed = hashes.get(file)
+
+                count('bytes', entry.stat.st_size)
+
+                # Files that are not valid images are cached too so they are skipped until they change, other
+                # failures (I/O, memory) may not happen again and are retried on the next run
+                if cache is not None and (hashed is not None or file in invalid):
+                    cache.put(file, entry.stat, hashed)
+
+                if checkpoint is not None:
+                    checkpoint.add_file(file, hashed, entry.stat.st_size)
+
+                if writer is not None or store is not None:
+                    record(file, hashed, entry.stat.st_size)
+
+                outstanding[entry.directory] -= 1
+
+                if not outstanding[entry.directory] and entry.directory in listed:
+                    finish(entry.directory)
+
+            if not share and writer is None and store is None:
+                with stage('aggregate'):
+                    merge_results(processed, result)
+
+        if share:
+            with stage('aggregate'):
+                merge_results(processed, dict(shared))
+
+    if cache is not None:
+        cache.evict(directories)
+
+    if store is not None:
+        store.freeze()
+
+        return store
+
+    return processed
+
+
+def find_near_duplicates(processed: Dict, index: HammingIndex, confirm_threshold: int = None) -> Dict:
+    """
+    Groups hashes that are within the Hamming distance threshold of the index
+
+    Only the first hash of each key is indexed. When keys hold several hashes, matches are confirmed by checking that
+    every other hash is within confirm_threshold.
+
+    :param processed: Hashes mapped to the counter and the files having that hash
+    :param index: Index the first hash of each key is added to and searched in
+    :param confirm_threshold: Largest distance allowed between the other hashes of two matching keys
+    :return: Exact duplicates and clusters of similar images keyed by one of their hashes
+    """
+    def confirm(key: str, other: str) -> bool:
+        return all(
+            hamming_distance(hashed, other_hashed) <= confirm_threshold
+            for hashed, other_hashed in zip(split_key(key)[1:], split_key(other)[1:])
+        )
+
+    for hashed in processed:
+        index.add(hashed, split_key(hashed)[0])
+
+    duplicates = {hashed: data for hashed, data in processed.items() if data['counter'] > 1}
+
+    for group in index.clusters(processed.keys(), confirm=None if confirm_threshold is None else confirm):
+        cluster = {
+            "counter": 0,
+            "items": [],
+            "hashes": group
+        }
+
+        for hashed in group:
+            duplicates.pop(hashed, None)
+
+            cluster['counter'] += processed[hashed]['counter']
+            cluster['items'] += processed[hashed]['items']
+
+        duplicates[group[0]] = cluster
+
+    return duplicates
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Finds duplicate images across directories')
+
+    parser.add_argument('--directories', nargs='+', required=True)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--aggregation', choices=['local', 'manager'], default='local')
+    parser.add_argument('--cache', type=str, default=None)
+    parser.add_argument('--threshold', type=int, default=None)
+    parser.add_argument('--index', type=str, default=None)
+    parser.add_argument('--fast-decode', action='store_true')
+    parser.add_argument('--walk-threads', type=int, default=8)
+    parser.add_argument('--output-ndjson', type=str, default=None)
+    parser.add_argument('--checkpoint', type=str, default=None)
+    parser.add_argument('--checkpoint-interval', type=float, default=30.0)
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--hashes', nargs='+', default=list(DEFAULT_HASHES))
+    parser.add_argument('--confirm-threshold', type=int, default=None)
+    parser.add_argument('--store', type=str, default=None)
+    parser.add_argument('--profile', type=str, default=None)
+    parser.add_argument('--profile-workers', type=str, default=None)
+
+    args = parser.parse_args()
+
+    if args.resume and args.checkpoint is None:
+        parser.error('--resume requires --checkpoint')
+
+    if args.store is not None and args.output_ndjson is not None:
+        parser.error('--store cannot be used with --output-ndjson')
+
+    if args.profile_workers is not None and args.profile is None:
+        parser.error('--profile-workers requires --profile')
+
     start = time.time()
     logging.info('Memory (Before): ' + str(memory_profiler.memory_usage()) + 'MB')
 
-    directories = []
+    options = dict(
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+        aggregation=args.aggregation,
+        fast_decode=args.fast_decode,
+        walk_threads=args.walk_threads,
+        algorithms=args.hashes
+    )
+
+    with contextlib.ExitStack() as stack:
+        if args.profile is not None:
+            if args.profile_workers is not None:
+                os.makedirs(args.profile_workers, exist_ok=True)
+
+            profiler = stack.enter_context(Profiler(worker_directory=args.profile_workers, rss_interval=1.0))
 
-    with Manager() as manager:
-        results = manager.dict({})
-        lock = Lock()
+        if args.cache is not None:
+            # Reduced scale decoding drifts the hashes, so they are cached apart from the full scale ones
+            algorithm = ' '.join(args.hashes) + (' fast' if args.fast_decode else '')
+            options['cache'] = stack.enter_context(HashCache(args.cache, algorithm=algorithm))
 
-        procs = []
-        for directory in directories:
-            for item_a in get_directory_items(directory):
-                _, ext = os.path.splitext(item_a)
+        if args.output_ndjson is not None:
+            options['writer'] = stack.enter_context(NdjsonWriter(args.output_ndjson, truncate=True))
 
-                if ext[1:].lower() not in ['jpg', 'png', 'gif', 'bmp', 'tif', 'tiff']:
-                    continue
+        if args.checkpoint is not None:
+            options['checkpoint'] = stack.enter_context(
+                Checkpoint(args.checkpoint, resume=args.resume, interval=args.checkpoint_interval)
+            )
 
-                proc = Process(target=process, args=(item_a, results))
-                proc.start()
+        if args.store is not None:
+            options['store'] = ResultStore()
 
-                procs.append(proc)
+        results = scan(args.directories, **options)
 
-        for p in procs:
-            p.join()
+        if args.store is not None:
+            with stage('write'):
+                results.save(args.store)
 
         end_time = time.time() - start
 
-        json.dump({k: v for k, v in dict(results).items() if v['counter'] > 1}, open('results.json', 'w'), indent=4)
+        if args.output_ndjson is None:
+            if args.threshold is None:
+                duplicates = {k: v for k, v in results.items() if v['counter'] > 1}
+            else:
+                if args.index is not None and os.path.exists(args.index):
+                    index = HammingIndex.load(args.index)
+                else:
+                    index = HammingIndex(bits=get_hash_bits(args.hashes[0]), threshold=args.threshold)
+
+                with stage('cluster'):
+                    duplicates = find_near_duplicates(results, index, confirm_threshold=args.confirm_threshold)
+
+                if args.index is not None:
+                    index.save(args.index)
+
+            with stage('write'):
+                json.dump(duplicates, open('results.json', 'w'), indent=4)
+
+    if args.profile is not None:
+        profiler.save(args.profile)
 
     logging.info('Memory (After) : ' + str(memory_profiler.memory_usage()) + 'MB')
     logging.info(f"Took {end_time}s")
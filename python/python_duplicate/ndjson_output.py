@@ -0,0 +1,133 @@
+"""
+Incremental NDJSON output for the scanners and grouping of the records into duplicate clusters
+
+Records are appended to the output as they are produced so a crash only loses the records that were not flushed yet.
+Batches are written with a single write() on a file opened with O_APPEND so several processes can append to the same
+file without interleaving lines.
+
+The grouping step partitions the records by a hash of their key into temporary files and groups one partition at a
+time, so only a single partition has to fit in memory.
+
+Parameters:
+    --input NDJSON file written by a scanner
+    --output NDJSON file where one record per group with at least two items is written
+    --key Record field to group by
+    --partitions Number of partitions the records are split into
+
+Usage:
+    python -m python_duplicate.ndjson_output --input scan.ndjson --output duplicates.ndjson --key hash
+"""
+import argparse
+import json
+import os
+import tempfile
+import zlib
+from typing import Dict, Iterator, List, Tuple
+
+from python_duplicate.profiler import stage
+
+
+class NdjsonWriter(object):
+    """
+    This class appends records to an NDJSON file in batches.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, truncate: bool = False) -> None:
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+
+        if truncate:
+            flags |= os.O_TRUNC
+
+        self.path = path
+        self.batch_size = batch_size
+        self.fd = os.open(path, flags, 0o644)
+        self.lines: List[str] = []
+
+        super().__init__()
+
+    def __enter__(self) -> 'NdjsonWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def write(self, record: Dict) -> None:
+        self.lines.append(json.dumps(record) + '\n')
+
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        data = memoryview(''.join(self.lines).encode())
+
+        with stage('write'):
+            while data:
+                data = data[os.write(self.fd, data):]
+
+        self.lines = []
+
+    def close(self) -> None:
+        self.flush()
+        os.close(self.fd)
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    with open(path, 'r') as f:
+        for line in f:
+            # The last line may be incomplete if the scanner was interrupted
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def group_records(path: str, key: str = 'hash', partitions: int = 64) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Groups the records of an NDJSON file by one of their fields
+
+    :param path: NDJSON file to group
+    :param key: Record field to group by
+    :param partitions: Number of temporary partitions the records are split into
+    :return: Value of the key and the records having it, for every value shared by at least two records
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        writers = [NdjsonWriter(os.path.join(directory, f'{index}.ndjson')) for index in range(partitions)]
+
+        try:
+            for record in read_records(path):
+                if record.get(key) is None:
+                    continue
+
+                writers[zlib.crc32(str(record[key]).encode()) % partitions].write(record)
+        finally:
+            for writer in writers:
+                writer.close()
+
+        for writer in writers:
+            groups: Dict[str, List[Dict]] = {}
+
+            for record in read_records(writer.path):
+                groups.setdefault(record[key], []).append(record)
+
+            for value, records in groups.items():
+                if len(records) > 1:
+                    yield value, records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Groups the records of a scanner NDJSON output into duplicates')
+
+    parser.add_argument('--input', type=str, required=True)
+    parser.add_argument('--output', type=str, required=True)
+    parser.add_argument('--key', type=str, default='hash')
+    parser.add_argument('--partitions', type=int, default=64)
+
+    args = parser.parse_args()
+
+    with NdjsonWriter(args.output, truncate=True) as output:
+        for value, records in group_records(args.input, key=args.key, partitions=args.partitions):
+            output.write({
+                args.key: value,
+                "counter": len(records),
+                "items": [record['path'] for record in records]
+            })
@@ -0,0 +1,138 @@
+"""
+Registry of perceptual hashes computed from a single decode of each image
+
+Every algorithm declares the size the grayscale image is resized to and a vectorized function turning a batch of
+resized images into bits. The images are converted to grayscale once and resized once per distinct size, then every
+requested hash is computed from the same arrays.
+
+Algorithms are requested with a 'name:size' spec, e.g. 'dhash:72', 'ahash:8' or 'phash:8'. The bits are packed least
+significant first, only whole bytes are kept so size * size should be a multiple of 8.
+"""
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+import numpy
+from PIL import Image
+
+from python_duplicate.profiler import stage
+
+
+class HashAlgorithm(NamedTuple):
+    size: Tuple[int, int]
+    bits: Callable[[numpy.ndarray], numpy.ndarray]
+    length: int
+
+
+REGISTRY: Dict[str, Callable[..., HashAlgorithm]] = {}
+
+
+def register(name: str) -> Callable:
+    def decorator(factory: Callable[..., HashAlgorithm]) -> Callable[..., HashAlgorithm]:
+        REGISTRY[name] = factory
+
+        return factory
+
+    return decorator
+
+
+@register('dhash')
+def difference_hash(hash_size: int = 8) -> HashAlgorithm:
+    def bits(pixels: numpy.ndarray) -> numpy.ndarray:
+        # Compare adjacent pixels.
+        return pixels[:, :, :-1] > pixels[:, :, 1:]
+
+    return HashAlgorithm((hash_size + 1, hash_size), bits, hash_size * hash_size)
+
+
+@register('ahash')
+def average_hash(hash_size: int = 8) -> HashAlgorithm:
+    def bits(pixels: numpy.ndarray) -> numpy.ndarray:
+        return pixels > pixels.mean(axis=(1, 2), keepdims=True)
+
+    return HashAlgorithm((hash_size, hash_size), bits, hash_size * hash_size)
+
+
+@register('phash')
+def perceptual_hash(hash_size: int = 8, highfreq_factor: int = 4) -> HashAlgorithm:
+    size = hash_size * highfreq_factor
+
+    # DCT-II basis, coefficients[k] = 2 * sum(x[n] * cos(pi * k * (2n + 1) / 2N))
+    n = numpy.arange(size)
+    basis = 2 * numpy.cos(numpy.pi * numpy.outer(n, 2 * n + 1) / (2 * size))
+
+    def bits(pixels: numpy.ndarray) -> numpy.ndarray:
+        coefficients = basis @ pixels.astype(numpy.float64) @ basis.T
+        low = coefficients[:, :hash_size, :hash_size]
+
+        return low > numpy.median(low.reshape(len(low), -1), axis=1)[:, None, None]
+
+    return HashAlgorithm((size, size), bits, hash_size * hash_size)
+
+
+def get_algorithm(spec: str) -> HashAlgorithm:
+    name, _, size = spec.partition(':')
+
+    if name not in REGISTRY:
+        raise ValueError(f'Unknown hash algorithm: {name}, expected one of {", ".join(REGISTRY)}')
+
+    return REGISTRY[name](int(size)) if size else REGISTRY[name]()
+
+
+def get_hash_bits(spec: str) -> int:
+    return get_algorithm(spec).length // 8 * 8
+
+
+def get_resize_size(specs: Iterable[str]) -> Tuple[int, int]:
+    sizes = [get_algorithm(spec).size for spec in specs]
+
+    return max(size[0] for size in sizes), max(size[1] for size in sizes)
+
+
+def compute_hashes(images: Iterable[Image.Image], specs: Sequence[str]) -> List[List[bytes]]:
+    """
+    Computes several hashes of each image from a single grayscale conversion
+
+    :param images: Decoded PIL images
+    :param specs: Algorithms to compute as 'name:size'
+    :return: Packed hash of every algorithm for each image, in input order
+    """
+    algorithms = [get_algorithm(spec) for spec in specs]
+
+    with stage('resize'):
+        grayscale = [image.convert('L') for image in images]
+
+        if not grayscale:
+            return []
+
+        resized = {}
+
+        for size in {algorithm.size for algorithm in algorithms}:
+            resized[size] = numpy.stack([
+                numpy.asarray(image.resize(size, Image.LANCZOS), dtype=numpy.uint8) for image in grayscale
+            ])
+
+    hashes = []
+
+    with stage('hash'):
+        for algorithm in algorithms:
+            bits = algorithm.bits(resized[algorithm.size]).reshape(len(grayscale), -1)
+
+            # Incomplete trailing bytes are dropped
+            packed = numpy.packbits(bits, axis=1, bitorder='little')[:, :bits.shape[1] // 8]
+            hashes.append([row.tobytes() for row in packed])
+
+    return [list(image_hashes) for image_hashes in zip(*hashes)]
+
+
+def hash_images(images: Iterable[Image.Image], specs: Sequence[str]) -> List[str]:
+    """
+    Computes the hashes of each image as a single key, the hex string of every algorithm joined by '-'
+
+    :param images: Decoded PIL images
+    :param specs: Algorithms to compute as 'name:size'
+    :return: Key of each image, in input order
+    """
+    return ['-'.join(hashed.hex() for hashed in image_hashes) for image_hashes in compute_hashes(images, specs)]
+
+
+def split_key(key: str) -> List[int]:
+    return [int(part, 16) for part in key.split('-')]
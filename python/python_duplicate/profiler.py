@@ -0,0 +1,371 @@
+"""
+Lightweight instrumentation of the scanners
+
+Stages are timed with time.perf_counter_ns into log-linear histograms (4 buckets per power of two, so percentiles are
+within ~20%) and counters track throughput. Instrumented code calls the module level stage() and count() functions,
+which do nothing unless a profiler is active, so the hooks can stay in the hot paths.
+
+Worker processes record into their own profiler for the duration of a task and send a snapshot back with the task
+result, the parent merges the snapshots. Stage totals are therefore summed over all processes. Optionally every worker
+also runs cProfile and dumps its stats to worker-<pid>.pstats, which is much more expensive than the stage timings.
+
+The RSS of the parent and its children is sampled from a background thread.
+"""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import psutil
+
+ACTIVE: Optional['Profiler'] = None
+
+
+def get_bucket(elapsed: int) -> int:
+    length = elapsed.bit_length()
+
+    if length <= 2:
+        return elapsed
+
+    return (length - 2) * 4 + ((elapsed >> (length - 3)) & 3)
+
+
+def get_bucket_limit(bucket: int) -> int:
+    if bucket < 4:
+        return bucket + 1
+
+    return (5 + bucket % 4) << (bucket // 4 - 1)
+
+
+class Stage(object):
+    """
+    This class times a block of code into a stage of the profiler.
+    """
+    __slots__ = ('profiler', 'name', 'started')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.started = 0
+
+    def __enter__(self) -> 'Stage':
+        self.started = time.perf_counter_ns()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.profiler.add(self.name, time.perf_counter_ns() - self.started)
+
+
+class NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self) -> 'NullStage':
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class RssSampler(threading.Thread):
+    """
+    This class samples the resident memory of the current process and its children.
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        super().__init__(daemon=True)
+
+        self.interval = interval
+        self.process = psutil.Process()
+        self.started = time.time()
+        self.samples: List[Dict] = []
+        self.stopped = threading.Event()
+
+    def sample(self) -> None:
+        processes = [self.process] + self.process.children(recursive=True)
+        rss = 0
+
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+            except psutil.Error:
+                continue
+
+        self.samples.append({"elapsed": time.time() - self.started, "rss": rss, "processes": len(processes)})
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+class Profiler(object):
+    """
+    This class accumulates stage timings and counters.
+    """
+
+    def __init__(self, worker_directory: str = None, rss_interval: float = None) -> None:
+        self.worker_directory = worker_directory
+        self.rss_interval = rss_interval
+        self.started = time.time()
+        self.elapsed = None
+        self.sampler: Optional[RssSampler] = None
+        self.previous: Optional[Profiler] = None
+
+        self.counts = Counter()
+        self.totals = Counter()
+        self.maximums: Dict[str, int] = {}
+        self.histograms: Dict[str, Counter] = {}
+        self.counters = Counter()
+
+        super().__init__()
+
+    def __enter__(self) -> 'Profiler':
+        global ACTIVE
+
+        self.previous = ACTIVE
+        self.started = time.time()
+        ACTIVE = self
+
+        if self.rss_interval:
+            self.sampler = RssSampler(self.rss_interval)
+            self.sampler.sample()
+            self.sampler.start()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        global ACTIVE
+
+        ACTIVE = self.previous
+        self.elapsed = time.time() - self.started
+
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def stage(self, name: str) -> Stage:
+        return Stage(self, name)
+
+    def add(self, name: str, elapsed: int) -> None:
+        self.counts[name] += 1
+        self.totals[name] += elapsed
+
+        if elapsed > self.maximums.get(name, 0):
+            self.maximums[name] = elapsed
+
+        if name not in self.histograms:
+            self.histograms[name] = Counter()
+
+        self.histograms[name][get_bucket(elapsed)] += 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] += amount
+
+    def snapshot(self) -> Dict:
+        return {
+            "counts": dict(self.counts),
+            "totals": dict(self.totals),
+            "maximums": self.maximums,
+            "histograms": {name: dict(histogram) for name, histogram in self.histograms.items()},
+            "counters": dict(self.counters)
+        }
+
+    def merge(self, snapshot: Dict) -> None:
+        self.counts.update(snapshot['counts'])
+        self.totals.update(snapshot['totals'])
+        self.counters.update(snapshot['counters'])
+
+        for name, maximum in snapshot['maximums'].items():
+            if maximum > self.maximums.get(name, 0):
+                self.maximums[name] = maximum
+
+        for name, histogram in snapshot['histograms'].items():
+            self.histograms.setdefault(name, Counter()).update(histogram)
+
+    def get_percentile(self, name: str, percentile: float) -> float:
+        """
+        Gets the upper bound of the histogram bucket holding the percentile of a stage
+
+        :param name: Stage name
+        :param percentile: Between 0 and 100
+        :return: Duration in seconds
+        """
+        histogram = self.histograms[name]
+        rank = percentile / 100 * self.counts[name]
+        seen = 0
+
+        for bucket in sorted(histogram):
+            seen += histogram[bucket]
+
+            if seen >= rank:
+                return min(get_bucket_limit(bucket), self.maximums[name]) / 1e9
+
+        return self.maximums[name] / 1e9
+
+    def report(self) -> Dict:
+        elapsed = self.elapsed if self.elapsed is not None else time.time() - self.started
+
+        stages = {}
+
+        for name in self.counts:
+            stages[name] = {
+                "count": self.counts[name],
+                "total": self.totals[name] / 1e9,
+                "mean": self.totals[name] / self.counts[name] / 1e9,
+                "p50": self.get_percentile(name, 50),
+                "p90": self.get_percentile(name, 90),
+                "p99": self.get_percentile(name, 99),
+                "max": self.maximums[name] / 1e9,
+                "histogram": [
+                    {"le": get_bucket_limit(bucket) / 1e9, "count": count}
+                    for bucket, count in sorted(self.histograms[name].items())
+                ]
+            }
+
+        samples = self.sampler.samples if self.sampler is not None else []
+
+        return {
+            "elapsed": elapsed,
+            "stages": stages,
+            "counters": {
+                name: {"total": total, "per_second": total / elapsed if elapsed else None}
+                for name, total in self.counters.items()
+            },
+            "rss": {
+                "peak": max((sample['rss'] for sample in samples), default=None),
+                "samples": samples
+            }
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+
+def stage(name: str):
+    """
+    Times a block of code into the active profiler, does nothing if there is none
+
+    :param name: Stage name
+    :return: Context manager
+    """
+    if ACTIVE is None:
+        return NULL_STAGE
+
+    return ACTIVE.stage(name)
+
+
+def count(name: str, amount: int = 1) -> None:
+    if ACTIVE is not None:
+        ACTIVE.count(name, amount)
+
+
+def timed(name: str, items: Iterable) -> Iterator:
+    """
+    Times every step of an iterator into the active profiler
+
+    :param name: Stage name
+    :param items: Iterable to time
+    :return: Items of the iterable
+    """
+    if ACTIVE is None:
+        yield from items
+        return
+
+    profiler = ACTIVE
+    iterator = iter(items)
+
+    while True:
+        started = time.perf_counter_ns()
+
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+
+        profiler.add(name, time.perf_counter_ns() - started)
+
+        yield item
+
+
+def run_profiled(task: Callable, worker_directory: Optional[str], *args) -> Any:
+    """
+    Runs a task in a worker with a profiler of its own
+
+    :param task: Task to run
+    :param worker_directory: Directory where the cProfile stats of the worker are dumped, not profiled if None
+    :param args: Arguments of the task
+    :return: Result of the task and the snapshot of the profiler
+    """
+    profile = None
+
+    if worker_directory is not None:
+        profile = cProfile.Profile()
+
+    with Profiler() as profiler:
+        if profile is not None:
+            profile.enable()
+
+        try:
+            result = task(*args)
+        finally:
+            if profile is not None:
+                profile.disable()
+                dump_worker_stats(profile, worker_directory)
+
+    return result, profiler.snapshot()
+
+
+def dump_worker_stats(profile: cProfile.Profile, worker_directory: str) -> None:
+    path = os.path.join(worker_directory, f'worker-{os.getpid()}.pstats')
+    stats = pstats.Stats(profile)
+
+    # Stats of the previous tasks of this worker are accumulated
+    if os.path.exists(path):
+        stats.add(path)
+
+    stats.dump_stats(path)
+
+
+def profiled(task: Callable) -> Callable:
+    """
+    Wraps a task sent to worker processes so its stages are recorded, returns the task unchanged if no profiler is
+    active
+
+    The wrapped task returns its result along with a profiler snapshot to merge with merge_result().
+
+    :param task: Picklable task
+    :return: Picklable task
+    """
+    if ACTIVE is None:
+        return task
+
+    return functools.partial(run_profiled, task, ACTIVE.worker_directory)
+
+
+def merge_result(result: Any) -> Any:
+    """
+    Merges the snapshot returned by a task wrapped by profiled() into the active profiler
+
+    :param result: Result of the wrapped task
+    :return: Result of the task itself
+    """
+    if ACTIVE is None:
+        return result
+
+    result, snapshot = result
+    ACTIVE.merge(snapshot)
+
+    return result
@@ -0,0 +1,277 @@
+"""
+Compact store of image hashes and paths for scans of millions of files
+
+Hashes are kept as fixed-width raw bytes in a single NumPy array instead of hex strings in dictionaries. Paths are split
+into an interned directory table and a blob of file names. Once frozen, the hashes are sorted so duplicates are
+contiguous, and lookups are binary searches.
+
+File names are appended to a byte blob as they are added so a scan holds no Python string per file, freeze() reorders
+the blob by hash with NumPy indexing.
+
+A store can be saved to a directory of .npy files which are memory-mapped when loaded, so a saved scan can be queried
+without parsing it.
+"""
+import json
+import os
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy
+
+# Number of names moved at once when the blob is reordered, which bounds the index array built for it
+REORDER_ROWS = 1 << 16
+
+
+def encode_blob(strings: Sequence[str]) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    encoded = [string.encode('utf-8', 'surrogateescape') for string in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(string) for string in encoded], out=offsets[1:])
+
+    return numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8), offsets
+
+
+def decode_blob(blob: numpy.ndarray, offsets: numpy.ndarray, index: int) -> str:
+    return blob[offsets[index]:offsets[index + 1]].tobytes().decode('utf-8', 'surrogateescape')
+
+
+def reorder_blob(blob: numpy.ndarray, offsets: numpy.ndarray,
+                 order: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Reorders the strings of a blob
+
+    :param blob: Concatenated strings
+    :param offsets: Start of every string in the blob, followed by the end of the last one
+    :param order: Index of the string placed at every position
+    :return: Reordered blob and its offsets
+    """
+    lengths = numpy.diff(offsets)[order]
+    reordered_offsets = numpy.zeros(len(order) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=reordered_offsets[1:])
+
+    reordered = numpy.empty(reordered_offsets[-1], dtype=numpy.uint8)
+
+    for start in range(0, len(order), REORDER_ROWS):
+        end = min(start + REORDER_ROWS, len(order))
+        first, last = reordered_offsets[start], reordered_offsets[end]
+
+        # Position in the source blob of every byte of the rows
+        shifts = offsets[order[start:end]] - reordered_offsets[start:end]
+        reordered[first:last] = blob[numpy.arange(first, last) + numpy.repeat(shifts, lengths[start:end])]
+
+    return reordered, reordered_offsets
+
+
+class ResultStore(Mapping):
+    """
+    This class stores the hash of every file and groups the files by hash.
+
+    It behaves like the results dictionary of image_duplicate.scan, mapping each hash key to its counter and items.
+    """
+
+    def __init__(self, widths: Sequence[int] = None) -> None:
+        self.widths = list(widths) if widths is not None else None
+
+        # Appended to while scanning
+        self.pending_hashes = bytearray()
+        self.pending_directories = array('i')
+        self.pending_names = bytearray()
+        self.pending_name_offsets = array('q', [0])
+        self.directory_ids: Dict[str, int] = {}
+        self.directories: List[str] = []
+
+        # Built by freeze()
+        self.hashes = numpy.zeros(0, dtype='S1')
+        self.file_directories = numpy.zeros(0, dtype=numpy.int32)
+        self.names = numpy.zeros(0, dtype=numpy.uint8)
+        self.name_offsets = numpy.zeros(1, dtype=numpy.int64)
+        self.starts = numpy.zeros(1, dtype=numpy.int64)
+
+        super().__init__()
+
+    def encode_key(self, key: str) -> bytes:
+        parts = [bytes.fromhex(part) for part in key.split('-')]
+
+        if [len(part) for part in parts] != self.widths:
+            raise ValueError(f'Hash key {key} does not have the widths {self.widths} of the store')
+
+        return b''.join(parts)
+
+    def decode_key(self, hashed: bytes) -> str:
+        parts = []
+        offset = 0
+
+        for width in self.widths:
+            parts.append(hashed[offset:offset + width].hex())
+            offset += width
+
+        return '-'.join(parts)
+
+    def add(self, key: str, path: str) -> None:
+        directory, name = os.path.split(path)
+
+        # Only the keys added set the widths, a looked up key could have any shape
+        if self.widths is None:
+            self.widths = [len(part) // 2 for part in key.split('-')]
+
+        if directory not in self.directory_ids:
+            self.directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+
+        self.pending_hashes += self.encode_key(key)
+        self.pending_directories.append(self.directory_ids[directory])
+        self.pending_names += name.encode('utf-8', 'surrogateescape')
+        self.pending_name_offsets.append(len(self.pending_names))
+
+    def freeze(self) -> None:
+        """
+        Merges the files added since the last freeze and sorts everything by hash
+        """
+        if len(self.pending_name_offsets) == 1:
+            return
+
+        width = sum(self.widths)
+        blob = numpy.concatenate([self.names, numpy.frombuffer(self.pending_names, dtype=numpy.uint8)])
+        pending_offsets = numpy.frombuffer(self.pending_name_offsets, dtype=numpy.int64)
+        offsets = numpy.concatenate([self.name_offsets, pending_offsets[1:] + self.name_offsets[-1]])
+
+        hashes = numpy.concatenate([
+            numpy.frombuffer(self.hashes.tobytes(), dtype=numpy.uint8),
+            numpy.frombuffer(self.pending_hashes, dtype=numpy.uint8)
+        ]).view(f'S{width}')
+        file_directories = numpy.concatenate([
+            self.file_directories, numpy.frombuffer(self.pending_directories, dtype=numpy.int32)
+        ])
+
+        order = numpy.argsort(hashes, kind='stable')
+
+        self.hashes = hashes[order]
+        self.file_directories = file_directories[order]
+        self.names, self.name_offsets = reorder_blob(blob, offsets, order)
+
+        changes = numpy.flatnonzero(self.hashes[1:] != self.hashes[:-1]) + 1
+        self.starts = numpy.concatenate([[0], changes, [len(self.hashes)]]).astype(numpy.int64)
+
+        self.pending_hashes = bytearray()
+        self.pending_directories = array('i')
+        self.pending_names = bytearray()
+        self.pending_name_offsets = array('q', [0])
+
+    def get_name(self, index: int) -> str:
+        return decode_blob(self.names, self.name_offsets, index)
+
+    def get_path(self, index: int) -> str:
+        return os.path.join(self.directories[self.file_directories[index]], self.get_name(index))
+
+    def get_hash(self, index: int) -> bytes:
+        return self.hashes[index:index + 1].tobytes()
+
+    def find(self, key: str) -> Tuple[int, int]:
+        self.freeze()
+
+        # Keys of another shape (or not hex) cannot be stored, they would be truncated to the stored width otherwise
+        try:
+            hashed = numpy.array([self.encode_key(key)], dtype=self.hashes.dtype)
+        except ValueError:
+            return 0, 0
+
+        start = numpy.searchsorted(self.hashes, hashed, 'left')[0]
+        end = numpy.searchsorted(self.hashes, hashed, 'right')[0]
+
+        return int(start), int(end)
+
+    def count(self, key: str) -> int:
+        start, end = self.find(key)
+
+        return end - start
+
+    def paths(self, key: str) -> List[str]:
+        start, end = self.find(key)
+
+        return [self.get_path(index) for index in range(start, end)]
+
+    def groups(self) -> Iterator[Tuple[str, int, int]]:
+        self.freeze()
+
+        for start, end in zip(self.starts[:-1], self.starts[1:]):
+            yield self.decode_key(self.get_hash(start)), int(start), int(end)
+
+    def duplicates(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Iterates over the hashes shared by at least two files
+
+        :return: Hash key and the paths of the files having it
+        """
+        for key, start, end in self.groups():
+            if end - start > 1:
+                yield key, [self.get_path(index) for index in range(start, end)]
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        for key, start, end in self.groups():
+            yield key, {
+                "counter": end - start,
+                "items": [self.get_path(index) for index in range(start, end)]
+            }
+
+    def __getitem__(self, key: str) -> Dict:
+        paths = self.paths(key)
+
+        if not paths:
+            raise KeyError(key)
+
+        return {
+            "counter": len(paths),
+            "items": paths
+        }
+
+    def __iter__(self) -> Iterator[str]:
+        for key, _, _ in self.groups():
+            yield key
+
+    def __len__(self) -> int:
+        self.freeze()
+
+        return len(self.starts) - 1
+
+    def save(self, directory: str) -> None:
+        self.freeze()
+
+        os.makedirs(directory, exist_ok=True)
+
+        directories, directory_offsets = encode_blob(self.directories)
+
+        for name, values in [
+            ('hashes', self.hashes),
+            ('file_directories', self.file_directories),
+            ('names', self.names),
+            ('name_offsets', self.name_offsets),
+            ('starts', self.starts),
+            ('directories', directories),
+            ('directory_offsets', directory_offsets),
+        ]:
+            numpy.save(os.path.join(directory, f'{name}.npy'), values)
+
+        with open(os.path.join(directory, 'store.json'), 'w') as f:
+            json.dump({'widths': self.widths}, f)
+
+    @staticmethod
+    def load(directory: str) -> 'ResultStore':
+        def load_array(name: str) -> numpy.ndarray:
+            return numpy.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+        with open(os.path.join(directory, 'store.json'), 'r') as f:
+            store = ResultStore(json.load(f)['widths'])
+
+        store.hashes = load_array('hashes')
+        store.file_directories = load_array('file_directories')
+        store.names = load_array('names')
+        store.name_offsets = load_array('name_offsets')
+        store.starts = load_array('starts')
+
+        directories, directory_offsets = load_array('directories'), load_array('directory_offsets')
+        store.directories = [
+            decode_blob(directories, directory_offsets, index) for index in range(len(directory_offsets) - 1)
+        ]
+        store.directory_ids = {directory: index for index, directory in enumerate(store.directories)}
+
+        return store
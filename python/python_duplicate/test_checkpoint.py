@@ -0,0 +1,139 @@
+"""
+Tests that a scan interrupted partway and resumed from its checkpoint gives the same results as an uninterrupted scan
+
+Run from the python directory:
+    python -m pytest python_duplicate/test_checkpoint.py
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import numpy
+import pytest
+from PIL import Image
+
+from python_duplicate import image_duplicate
+from python_duplicate.checkpoint import Checkpoint
+from python_duplicate.ndjson_output import read_records
+
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGGREGATIONS = ['local', 'manager']
+
+
+def generate_tree(directory: str, images: int, subdirectories: int = 8) -> int:
+    random = numpy.random.default_rng(0)
+    files = 0
+
+    for index in range(images):
+        image = Image.fromarray(random.integers(0, 256, (32, 32, 3), dtype=numpy.uint8))
+
+        # Every fourth image is saved again in another directory so there are duplicates
+        for copy in range(2 if index % 4 == 0 else 1):
+            subdirectory = os.path.join(directory, str((index + copy) % subdirectories))
+            os.makedirs(subdirectory, exist_ok=True)
+
+            image.save(os.path.join(subdirectory, f'{index}-{copy}.png'))
+            files += 1
+
+    return files
+
+
+def normalize(results) -> dict:
+    return {hashed: sorted(data['items']) for hashed, data in results.items()}
+
+
+def count_records(path: str) -> int:
+    return sum(1 for record in read_records(path) if 'path' in record) if os.path.exists(path) else 0
+
+
+@pytest.fixture(scope='module')
+def tree(tmp_path_factory) -> tuple:
+    directory = str(tmp_path_factory.mktemp('images'))
+
+    return directory, generate_tree(directory, 200)
+
+
+@pytest.mark.parametrize('aggregation', AGGREGATIONS)
+def test_interrupted_scan_resumes(tree, tmp_path, monkeypatch, aggregation):
+    directory, files = tree
+    options = dict(processes=2, chunk_size=4, aggregation=aggregation)
+    path = str(tmp_path / 'checkpoint.ndjson')
+
+    expected = normalize(image_duplicate.scan([directory], **options))
+    assert any(len(items) > 1 for items in expected.values())
+
+    get_image_entries = image_duplicate.get_image_entries
+
+    def interrupted(*args, **kwargs):
+        for index, entry in enumerate(get_image_entries(*args, **kwargs)):
+            if index == files // 2:
+                raise KeyboardInterrupt
+
+            yield entry
+
+    monkeypatch.setattr(image_duplicate, 'get_image_entries', interrupted)
+
+    with Checkpoint(path, interval=0) as checkpoint:
+        with pytest.raises(KeyboardInterrupt):
+            image_duplicate.scan([directory], checkpoint=checkpoint, **options)
+
+    monkeypatch.setattr(image_duplicate, 'get_image_entries', get_image_entries)
+
+    assert 0 < count_records(path) < files
+
+    with Checkpoint(path, resume=True) as checkpoint:
+        resumed = image_duplicate.scan([directory], checkpoint=checkpoint, **options)
+
+    assert normalize(resumed) == expected
+
+
+def run_scan(directory: str, cwd: str, *arguments: str) -> subprocess.Popen:
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([PYTHON_DIRECTORY, os.environ.get('PYTHONPATH', '')]))
+
+    return subprocess.Popen(
+        [sys.executable, '-m', 'python_duplicate.image_duplicate', '--directories', directory, *arguments],
+        cwd=cwd,
+        env=environment,
+        start_new_session=True
+    )
+
+
+def read_duplicates(cwd: str) -> dict:
+    with open(os.path.join(cwd, 'results.json')) as f:
+        return normalize(json.load(f))
+
+
+@pytest.mark.parametrize('aggregation', AGGREGATIONS)
+def test_killed_scan_resumes(tree, tmp_path, aggregation):
+    directory, files = tree
+    arguments = ['--processes', '1', '--chunk-size', '1', '--aggregation', aggregation]
+    path = str(tmp_path / 'checkpoint.ndjson')
+
+    uninterrupted, killed = tmp_path / 'uninterrupted', tmp_path / 'killed'
+    uninterrupted.mkdir()
+    killed.mkdir()
+
+    assert run_scan(directory, str(uninterrupted), *arguments).wait(timeout=120) == 0
+
+    process = run_scan(directory, str(killed), *arguments, '--checkpoint', path, '--checkpoint-interval', '0')
+    deadline = time.time() + 60
+
+    while count_records(path) < 10 and process.poll() is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    # Kills the workers too, nothing is flushed or closed
+    os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+
+    assert process.returncode == -signal.SIGKILL
+    assert 0 < count_records(path) < files
+    assert not (killed / 'results.json').exists()
+
+    resumed = run_scan(directory, str(killed), *arguments, '--checkpoint', path, '--resume')
+
+    assert resumed.wait(timeout=120) == 0
+    assert read_duplicates(str(uninterrupted))
+    assert read_duplicates(str(killed)) == read_duplicates(str(uninterrupted))
@@ -0,0 +1,39 @@
+"""
+Tests that looking up keys of another shape in a ResultStore finds nothing instead of matching truncated hashes
+
+Run from the python directory:
+    python -m pytest python_duplicate/test_result_store.py
+"""
+import pytest
+
+from python_duplicate.result_store import ResultStore
+
+
+def test_lookup_on_empty_store_does_not_set_widths():
+    store = ResultStore()
+
+    assert 'aabb-cc' not in store
+    assert store.widths is None
+
+    store.add('aabbccdd-ee', '/images/a.png')
+
+    assert store.widths == [4, 1]
+    assert store['aabbccdd-ee'] == {'counter': 1, 'items': ['/images/a.png']}
+
+
+@pytest.mark.parametrize('key', ['aabbccdd-eeff', 'aabbccddee-ee', 'aabbcc-ee', 'aabbccdd', 'not-hex'])
+def test_lookup_of_another_shape_finds_nothing(key):
+    store = ResultStore()
+    store.add('aabbccdd-ee', '/images/a.png')
+    store.add('aabbccdd-ee', '/images/b.png')
+
+    assert store.count(key) == 0
+    assert key not in store
+
+
+def test_add_of_another_shape_raises():
+    store = ResultStore()
+    store.add('aabbccdd-ee', '/images/a.png')
+
+    with pytest.raises(ValueError):
+        store.add('aabbccddee-ee', '/images/b.png')
@@ -0,0 +1,48 @@
+"""
+Tests that encode_stream reads JSON arrays split across reads and only writes valid JSON
+
+Run from the python directory:
+    python -m pytest test_encode_stream.py
+"""
+import io
+import json
+
+import pytest
+
+import encode_stream
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 5, 8])
+def test_read_array_number_across_reads(monkeypatch, read_size):
+    monkeypatch.setattr(encode_stream, 'READ_SIZE', read_size)
+    text = '[12.5, -3e10,{"a": [1, 2]} ,"x",7]'
+
+    items = list(encode_stream.read_array(io.StringIO(text)))
+
+    assert items == ['12.5', '-3e10', '{"a": [1, 2]}', '"x"', '7']
+
+
+def test_read_array_fraction_split_after_point(monkeypatch):
+    # The first read ends with "12." which would decode as 12 if the item was yielded before the next read
+    monkeypatch.setattr(encode_stream, 'READ_SIZE', 4)
+
+    assert list(encode_stream.read_array(io.StringIO('[12.5]'))) == ['12.5']
+
+
+def test_encode_records_keeps_overflowing_decimals():
+    records = encode_stream.encode_records([json.dumps({'big': '1e999', 'small': '1.5'})])
+
+    assert [json.loads(record) for record in records] == [{'big': '1e999', 'small': 1.5}]
+
+
+def test_encode_file_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(encode_stream, 'READ_SIZE', 7)
+    source, target = tmp_path / 'input.json', tmp_path / 'output.json'
+    records = [{'id': str(index), 'price': f'{index}.25', 'date': f'2024-01-{index + 1:02}'} for index in range(20)]
+    source.write_text(json.dumps(records))
+
+    assert encode_stream.encode_file(str(source), str(target), processes=1, chunk_size=3) == len(records)
+
+    assert json.loads(target.read_text()) == [
+        {'id': index, 'price': index + 0.25, 'date': f'2024-01-{index + 1:02}'} for index in range(20)
+    ]
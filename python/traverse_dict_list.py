@@ -1,70 +1,296 @@
+import itertools
 import re
-from copy import deepcopy
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, List, Optional
+
+# Optional minus sign, digits, optional fraction and optional exponent, e.g. -12, 1.5, 1.5e3, 2E-4
+NUMBER = re.compile(r'-?[0-9]+(\.[0-9]+)?([eE][-+]?[0-9]+)?')
+NUMBER_START = frozenset('-0123456789')
+
+# Returned by compiled converters when a record does not have the learned shape
+DEVIATION = object()
 
 
 class Encode(object):
     """
     This class searches for string respresentation of numbers in a nested dict or list and converts them
     to their proper format.
+
+    Numbers with a fraction or an exponent are converted with DECIMAL, float by default. It can be set to
+    decimal.Decimal to keep their exact value or to str to leave them untouched.
     """
+    DECIMAL: Callable[[str], Any] = float
 
     @staticmethod
-    def traverse_dict(d: Dict) -> Dict:
+    def traverse(obj: Any, in_place: bool = False) -> Any:
+        """
+        Traverse a nested dict or list to look for and parse string numbers
+
+        The structure is walked iteratively with an explicit stack so deeply nested objects do not hit the recursion
+        limit. Each dict and list is copied once (shallow) unless in_place is set, in which case the given object is
+        modified and returned.
+
+        :param obj: Object to traverse
+        :param in_place: Whether to convert the object itself instead of a copy
+        :return: Traversed object where string types are already parsed
+        """
+        if isinstance(obj, dict):
+            root = obj if in_place else dict(obj)
+        elif isinstance(obj, list):
+            root = obj if in_place else list(obj)
+        else:
+            return Encode.guess_encode(obj)
+
+        stack = [root]
+
+        while stack:
+            container = stack.pop()
+
+            # Only existing keys are reassigned so the dict can be modified while iterating
+            for key, value in container.items() if isinstance(container, dict) else enumerate(container):
+                if isinstance(value, str):
+                    container[key] = Encode.parse_string(value)
+                elif isinstance(value, dict):
+                    container[key] = value if in_place else dict(value)
+                    stack.append(container[key])
+                elif isinstance(value, list):
+                    container[key] = value if in_place else list(value)
+                    stack.append(container[key])
+
+        return root
+
+    @staticmethod
+    def traverse_dict(d: Dict, in_place: bool = False) -> Dict:
         """
         Traverse a dictionary to look for and parse string numbers
 
         :param d: Dictionary object to traverse
+        :param in_place: Whether to convert the dictionary itself instead of a copy
         :return: Traversed dictionary where string types are already parsed
         """
-        d_c: Dict = deepcopy(d)
-
-        for key, value in d_c.items():
-            d_c[key] = Encode.guess_encode(value)
-
-        return d_c
+        return Encode.traverse(d, in_place)
 
     @staticmethod
-    def traverse_list(l: List) -> List:
+    def traverse_list(l: List, in_place: bool = False) -> List:
         """
         Traverse a list to look for and parse string numbers
 
         :param l: List object to traverse
+        :param in_place: Whether to convert the list itself instead of a copy
         :return: Traversed list where string types are already parsed
         """
-        l_c = deepcopy(l)
-
-        for idx, item in enumerate(l_c):
-            l_c[idx] = Encode.guess_encode(item)
-
-        return l_c
+        return Encode.traverse(l, in_place)
 
     @staticmethod
     def parse_string(string: str) -> [str, int, float]:
         """
-        Returns a number if the string is a valid number else return the string
+        Returns a number if the whole string is a valid number else return the string
+
+        Strings that cannot start a number are returned before any regex is run, which is the common case.
 
         :param string: String object to check
-        :return: int number or float number or string
+        :return: int number or decimal number (see DECIMAL) or string
         """
-        if re.match(r'\d+\.\d+', string):
-            return float(string)
-        elif re.match(r'\d+', string):
-            return int(string)
+        if not string or string[0] not in NUMBER_START:
+            return string
 
-        return string
+        match = NUMBER.fullmatch(string)
+
+        if match is None:
+            return string
+
+        if match.lastindex is None:
+            try:
+                return int(string)
+            except ValueError:
+                # Integers longer than sys.get_int_max_str_digits() are refused by int()
+                return string
+
+        return Encode.DECIMAL(string)
 
     @staticmethod
-    def guess_encode(obj: Any) -> Any:
+    def guess_encode(obj: Any, in_place: bool = False) -> Any:
         """
         Check type to determine appropriate traversal
 
         :param obj: Object to traverse
+        :param in_place: Whether nested dicts and lists are converted themselves instead of copies
         :return: Traversed object
         """
         if isinstance(obj, Dict):
-            return Encode.traverse_dict(obj)
+            return Encode.traverse_dict(obj, in_place)
         elif isinstance(obj, List):
-            return Encode.traverse_list(obj)
+            return Encode.traverse_list(obj, in_place)
         elif isinstance(obj, str):
             return Encode.parse_string(obj)
+
+        # Numbers, booleans and None are kept as they are
+        return obj
+
+    @staticmethod
+    def get_kind(obj: Any) -> Any:
+        """
+        Describes what the conversion of an object depends on
+
+        :param obj: Object to describe
+        :return: 'int', 'decimal' or 'text' for strings, 'any' for lists, the kind of every value (in key order) for
+                 dicts and the type for other values
+        """
+        if obj.__class__ is str:
+            match = NUMBER.fullmatch(obj) if obj[:1] in NUMBER_START else None
+
+            if match is None:
+                return 'text'
+
+            return 'int' if match.lastindex is None else 'decimal'
+        elif obj.__class__ is dict:
+            return {key: Encode.get_kind(value) for key, value in obj.items()}
+        elif obj.__class__ is list:
+            return 'any'
+
+        return obj.__class__
+
+    @staticmethod
+    def merge_kinds(kind: Any, other: Any) -> Any:
+        if isinstance(kind, dict) and isinstance(other, dict):
+            if tuple(kind) != tuple(other):
+                return 'any'
+
+            return {key: Encode.merge_kinds(kind[key], other[key]) for key in kind}
+
+        return kind if kind == other else 'any'
+
+    @staticmethod
+    def learn_schema(records: List) -> Optional[Dict]:
+        """
+        Learns the shape of a sample of records, the key paths holding numbers, text or other values
+
+        Key paths whose kind differs between records of the same shape are converted with the generic path.
+
+        :param records: Sample of records
+        :return: Kind of the records (see get_kind) or None if the first record is not a dict
+        """
+        if not records or records[0].__class__ is not dict:
+            return None
+
+        schema = Encode.get_kind(records[0])
+
+        for record in records[1:]:
+            if record.__class__ is dict and tuple(record) == tuple(schema):
+                schema = Encode.merge_kinds(schema, Encode.get_kind(record))
+
+        return schema
+
+    @staticmethod
+    def compile_schema(schema: Dict, in_place: bool = False) -> Callable[[Dict], Any]:
+        """
+        Generates a converter specialized for records of a learned shape
+
+        Every value is checked against its learned kind, the converter returns DEVIATION as soon as one does not match
+        (or the keys differ) so the record can go through the generic path instead.
+
+        :param schema: Kind of the records, see learn_schema
+        :param in_place: Whether records are converted themselves instead of copies
+        :return: Converter returning the converted record or DEVIATION
+        """
+        namespace = {'DEVIATION': DEVIATION, 'Encode': Encode, 'NUMBER': NUMBER, 'NUMBER_START': NUMBER_START}
+        lines = ['def convert(record):']
+        names = (f'_{index}' for index in itertools.count())
+
+        def deviate_if(condition: str, indent: str) -> None:
+            lines.append(f'{indent}if {condition}:')
+            lines.append(f'{indent}    return DEVIATION')
+
+        def add_dict(source: str, shape: Dict, indent: str = '    ') -> str:
+            keys = 'keys' + next(names)
+            namespace[keys] = tuple(shape)
+            deviate_if(f'{source}.__class__ is not dict or tuple({source}) != {keys}', indent)
+
+            values = []
+
+            for key, kind in shape.items():
+                value = 'value' + next(names)
+                lines.append(f'{indent}{value} = {source}[{key!r}]')
+
+                if kind == 'int':
+                    deviate_if(
+                        f'{value}.__class__ is not str or not {value}.isascii() or not '
+                        f'({value}.isdigit() or {value}[:1] == "-" and {value}[1:].isdigit())',
+                        indent
+                    )
+                    # Too long for int() is a deviation, the generic path keeps the string
+                    lines.append(f'{indent}try:')
+                    lines.append(f'{indent}    {value} = int({value})')
+                    lines.append(f'{indent}except ValueError:')
+                    lines.append(f'{indent}    return DEVIATION')
+                elif kind == 'decimal':
+                    # Plain fractions are checked without the regex, which is only run for exponents
+                    head, tail = 'head' + next(names), 'tail' + next(names)
+                    deviate_if(f'{value}.__class__ is not str or not {value}.isascii()', indent)
+                    lines.append(f'{indent}{head}, _, {tail} = {value}.partition(".")')
+                    deviate_if(
+                        f'not ({tail}.isdigit() and ({head}.isdigit() or {head}[:1] == "-" and {head}[1:].isdigit())) '
+                        f'and (NUMBER.fullmatch({value}) is None or NUMBER.fullmatch({value}).lastindex is None)',
+                        indent
+                    )
+                    lines.append(f'{indent}{value} = Encode.DECIMAL({value})')
+                elif kind == 'text':
+                    # Text starting like a number (dates, phone numbers, IDs) only deviates if it is a whole number
+                    deviate_if(
+                        f'{value}.__class__ is not str or '
+                        f'{value}[:1] in NUMBER_START and NUMBER.fullmatch({value}) is not None',
+                        indent
+                    )
+                elif kind == 'any':
+                    lines.append(f'{indent}{value} = Encode.guess_encode({value}, {in_place})')
+                elif isinstance(kind, dict):
+                    value = add_dict(value, kind, indent)
+                else:
+                    value_type = 'type' + next(names)
+                    namespace[value_type] = kind
+                    deviate_if(f'{value}.__class__ is not {value_type}', indent)
+
+                values.append(value)
+
+            if not in_place:
+                return '{' + ', '.join(f'{key!r}: {value}' for key, value in zip(shape, values)) + '}'
+
+            # Nested dicts may already be converted if the record deviates afterwards, which is harmless since the
+            # conversion is idempotent
+            for key, value in zip(shape, values):
+                lines.append(f'{indent}{source}[{key!r}] = {value}')
+
+            return source
+
+        lines.append(f'    return {add_dict("record", schema)}')
+
+        exec('\n'.join(lines), namespace)
+
+        return namespace['convert']
+
+    @staticmethod
+    def encode_batch(records: List, sample_size: int = 100, in_place: bool = False) -> List:
+        """
+        Converts a list of records that mostly share the same shape
+
+        A converter is compiled for the shape learned from the first records and applied to every record, records
+        that deviate from it go through the generic path.
+
+        :param records: Records to convert
+        :param sample_size: Number of records the shape is learned from
+        :param in_place: Whether to convert the list and its records themselves instead of copies
+        :return: Converted records
+        """
+        schema = Encode.learn_schema(records[:sample_size])
+
+        if schema is None:
+            return Encode.traverse_list(records, in_place)
+
+        convert = Encode.compile_schema(schema, in_place)
+        converted = records if in_place else [None] * len(records)
+
+        for index, record in enumerate(records):
+            result = convert(record)
+
+            converted[index] = Encode.guess_encode(record, in_place) if result is DEVIATION else result
+
+        return converted